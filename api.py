@@ -1,15 +1,252 @@
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import httpx
+from openai import APIError, AsyncOpenAI
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
+from exports import EXPORT_MIME_TYPES, export_document
+from instrumentation import enable_opentelemetry, metrics
+from llm import AsyncLLMClient
+from llm_cache import ResponseCache
+from prompts import build_prompt
+from retry import HedgePolicy, RetryPolicy
+from token_accounting import UsageLedger
+
+# Two services in one app:
+#
+# The outline service (/api/v1/outlines/...) builds prompts, calls the LLM
+# provider and parses the outline, so the Streamlit UI only has to send the
+# story material (set OUTLINE_SERVICE_URL=http://127.0.0.1:8000 for the app).
+# All requests in a worker share one AsyncOpenAI client and its connection
+# pool; OPENAI_API_KEY / OPENAI_BASE_URL select the provider. Failed calls
+# are retried with jittered backoff (OUTLINE_SERVICE_MAX_RETRIES) and, with
+# OUTLINE_SERVICE_HEDGE=1, slow calls get a duplicate after the p95 latency.
+# Run several workers with OUTLINE_SERVICE_WORKERS=4 python api.py.
+# Span timings (LLM calls, parsing, exports) are served as Prometheus text at
+# /metrics, per worker; OUTLINE_OTEL=1 also sends them to an OTLP collector.
+#
+# The mock LLM (/v1/chat/completions) stands in for the OpenAI chat
+# completions API, for running and load-testing the app offline. Point the
+# app (or the outline service) at it with
+#     OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock streamlit run streamlit_app.py
+#
+# Behaviour is configured with environment variables (and can be changed at
+# runtime through /mock/config):
+#   MOCK_TTFT_MS            time to first token, a distribution spec (below)
+#   MOCK_TOKENS_PER_S       completion token rate, 0 for instant responses
+#   MOCK_ERROR_RATE         fraction of requests that fail (0..1)
+#   MOCK_ERROR_CODES        comma-separated status codes to fail with
+#   MOCK_MAX_CONCURRENCY    requests served at once, 0 for no limit
+#   MOCK_QUEUE_TIMEOUT_S    how long a request waits for a slot before a 429
+#   MOCK_SEED               seed for reproducible outlines and latencies
+# Distribution specs: "fixed:MS", "uniform:LOW:HIGH", "normal:MEAN:SD",
+# "lognormal:MEDIAN:SIGMA" or "exponential:MEAN" (all in milliseconds).
+
 app = FastAPI();
 
+config = {
+	"ttft_ms": os.environ.get("MOCK_TTFT_MS", "lognormal:600:0.5"),
+	"tokens_per_s": float(os.environ.get("MOCK_TOKENS_PER_S", "80")),
+	"error_rate": float(os.environ.get("MOCK_ERROR_RATE", "0")),
+	"error_codes": os.environ.get("MOCK_ERROR_CODES", "429,500,503"),
+	"max_concurrency": int(os.environ.get("MOCK_MAX_CONCURRENCY", "8")),
+	"queue_timeout_s": float(os.environ.get("MOCK_QUEUE_TIMEOUT_S", "30")),
+	"seed": os.environ.get("MOCK_SEED"),
+}
+
+stats = Counter()
+rng = random.Random(config["seed"])
+_slots = None
+_slots_size = None
+# Prompt prefixes seen recently, to report cached prompt tokens like the real API
+_seen_prefixes = OrderedDict()
+
+CHARS_PER_TOKEN = 4
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_BLOCK_TOKENS = 128
+
+ACT_NAMES = {1: ("Act I", "Setup"), 2: ("Act II", "Rising Action"), 3: ("Act III", "Climax & Resolution")}
+ACT_NUMBERS = {"I": 1, "II": 2, "III": 3}
+
+BEAT_TEMPLATES = {
+	1: [
+		"{a} is introduced going about an ordinary life, hiding a private wound.",
+		"{a} crosses paths with {b}, whose arrival unsettles everyone.",
+		"A strange discovery hints that something is wrong beneath the surface.",
+		"{c} delivers news that makes staying put impossible for {a}.",
+		"{a} refuses the call at first, unwilling to risk what little they have.",
+		"A loss close to home forces {a} to commit to the journey.",
+		"{a} and {b} strike an uneasy alliance and set out together.",
+		"The first threshold is crossed and there is no going back.",
+	],
+	2: [
+		"{a} faces the first real test and barely survives it.",
+		"{b} reveals a secret that changes how {a} sees the mission.",
+		"New allies join, each with their own reasons for helping.",
+		"{c} tightens the pressure, always one step ahead.",
+		"A victory at the midpoint turns out to be a carefully laid trap.",
+		"Trust between {a} and {b} fractures after a betrayal.",
+		"{a} is forced to confront the wound they have been avoiding.",
+		"Everything falls apart and {a} is left alone with nothing.",
+	],
+	3: [
+		"{a} finds a reason to keep going in an unexpected memory.",
+		"{a} and {b} reconcile and make a plan against the odds.",
+		"The final confrontation with {c} begins on {c}'s own ground.",
+		"A sacrifice turns the tide at the worst possible moment.",
+		"{a} makes the choice that the whole story has been building toward.",
+		"The truth comes out and the old order cannot stand.",
+		"{a} returns home changed, carrying what was learned.",
+		"A final image mirrors the opening, showing how far everyone has come.",
+	],
+}
+FALLBACK_NAMES = ["the hero", "an unlikely ally", "the antagonist"]
+NOT_NAMES = frozenset({
+	"The", "A", "An", "And", "But", "Act", "Key", "Setup", "Rising", "Action", "Climax", "Resolution",
+	"Create", "Generate", "Story", "Task", "Current", "Additional", "Provide", "Use", "Keep", "Focus",
+	"Promote", "Do", "NOT", "ONLY", "EXACTLY", "When", "He", "She", "They", "It", "His", "Her", "Their",
+	"In", "On", "At", "Of", "To", "Then", "After", "Before", "This", "That", "There", "One",
+})
+
+
+def _sample_ms(spec):
+	"""Draw one value (in seconds) from a distribution spec such as "lognormal:600:0.5"."""
+	kind, *params = spec.split(":")
+	params = [float(p) for p in params]
+	if kind == "fixed":
+		value = params[0]
+	elif kind == "uniform":
+		value = rng.uniform(params[0], params[1])
+	elif kind == "normal":
+		value = rng.gauss(params[0], params[1])
+	elif kind == "lognormal":
+		value = params[0] * rng.lognormvariate(0, params[1])
+	elif kind == "exponential":
+		value = rng.expovariate(1 / params[0]) if params[0] > 0 else 0
+	else:
+		raise ValueError(f"Unknown latency distribution: {spec}")
+	return max(value, 0) / 1000
+
+
+def _count_tokens(text):
+	return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _cached_tokens(messages, prompt_tokens):
+	"""Prompt tokens a provider-side prefix cache would have served."""
+	if prompt_tokens < PREFIX_CACHE_MIN_TOKENS:
+		return 0
+	text = "".join(m.get("content") or "" for m in messages)
+	cached = 0
+	# Longest block-aligned prefix seen before
+	for tokens in range(PREFIX_CACHE_MIN_TOKENS, prompt_tokens + 1, PREFIX_CACHE_BLOCK_TOKENS):
+		key = hashlib.sha256(text[:tokens * CHARS_PER_TOKEN].encode("utf-8")).hexdigest()
+		if key in _seen_prefixes:
+			_seen_prefixes.move_to_end(key)
+			cached = tokens
+		else:
+			_seen_prefixes[key] = True
+	while len(_seen_prefixes) > 10000:
+		_seen_prefixes.popitem(last=False)
+	return cached
+
+
+def _names(text):
+	counts = Counter(w for w in re.findall(r"\b[A-Z][a-z]{2,}\b", text) if w not in NOT_NAMES)
+	names = [name for name, _ in counts.most_common(3)]
+	return names + FALLBACK_NAMES[len(names):]
+
+
+def _beats(act, count, names, request_rng):
+	templates = BEAT_TEMPLATES[act]
+	order = request_rng.sample(range(len(templates)), len(templates))
+	# Keep the story order of the templates that were picked
+	picked = sorted(order[:count]) if count <= len(templates) else [i % len(templates) for i in range(count)]
+	a, b, c = names
+	beats = [templates[i].format(a=a, b=b, c=c) for i in picked]
+	return [beat[0].upper() + beat[1:] for beat in beats]
+
+
+def _outline_request(messages, response_format):
+	"""(acts, beats_per_act, structured) requested by an outline prompt."""
+	prompt = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+	schema = ((response_format or {}).get("json_schema") or {}).get("schema")
+	if schema:
+		properties = schema.get("properties", {})
+		acts = [int(key[3:]) for key in properties if re.fullmatch(r"act[123]", key)]
+		beats = next((p.get("minItems") for p in properties.values() if p.get("minItems")), 3)
+		return acts or [1, 2, 3], beats, True
+	single = re.search(r"ONLY the Act (III|II|I)\b", prompt)
+	beats = re.findall(r"(\d+) key beats", prompt)
+	return [ACT_NUMBERS[single.group(1)]] if single else [1, 2, 3], int(beats[-1]) if beats else 3, False
+
+
+def _completion_text(messages, response_format, request_rng):
+	"""A plausible answer: a chunk summary or an outline with the requested beats."""
+	system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+	user = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+	if "summarize" in system.lower():
+		sentences = re.split(r"(?<=[.!?])\s+", user.strip())
+		return " ".join(sentences[:max(1, len(sentences) // 4)])
+
+	acts, beats_per_act, structured = _outline_request(messages, response_format)
+	names = _names(user)
+	beats = {act: _beats(act, beats_per_act, names, request_rng) for act in acts}
+	if structured:
+		return json.dumps({f"act{act}": act_beats for act, act_beats in beats.items()})
+	lines = []
+	for act, act_beats in beats.items():
+		act_label, section = ACT_NAMES[act]
+		lines += [f"- {act_label}", f"- {section}"] + [f"    - {beat}" for beat in act_beats]
+	return "\n".join(lines)
+
+
+def _error(status, message, error_type):
+	headers = {"Retry-After": "1"} if status == 429 else None
+	return JSONResponse(
+		{"error": {"message": message, "type": error_type, "param": None, "code": None}},
+		status_code=status,
+		headers=headers,
+	)
+
+
+def _get_slots():
+	global _slots, _slots_size
+	if _slots_size != config["max_concurrency"]:
+		_slots_size = config["max_concurrency"]
+		_slots = asyncio.Semaphore(_slots_size) if _slots_size > 0 else None
+	return _slots
+
+
+def _stream_tokens(text):
+	# Words with their trailing whitespace are close enough to tokens here
+	return re.findall(r"\S+\s*|\s+", text)
+
+
 @app.get("/")
 async def root():
 	return {
 		"welcome_message": "Methods available",
 			"methods": [
 				{"change_outline": "http://localhost:8000/api/v1/methods/change_outline"},
-				{"receive_result": "http://localhost:8000/api/v1/methods/receive_result"}
+				{"receive_result": "http://localhost:8000/api/v1/methods/receive_result"},
+				{"chat_completions": "http://localhost:8000/v1/chat/completions"},
+				{"outlines": "http://localhost:8000/api/v1/outlines/{generate,regenerate,regenerate-act,export}"}
 			]
 	}
 
@@ -34,5 +271,239 @@ The knight, filled with hatred and revenge, finds his friend and kills him in fr
 """
 	}
 
+@app.get("/v1/models")
+async def list_models():
+	return {
+		"object": "list",
+		"data": [{"id": name, "object": "model", "created": 0, "owned_by": "mock"} for name in ("gpt-4o", "gpt-4o-mini")]
+	}
+
+@app.get("/mock/config")
+async def get_config():
+	return {"config": config, "stats": dict(stats)}
+
+@app.put("/mock/config")
+async def update_config(request: Request):
+	"""Change latency, error and concurrency settings between load-test runs."""
+	global rng
+	changes = await request.json()
+	unknown = set(changes) - set(config)
+	if unknown:
+		return _error(400, f"Unknown settings: {', '.join(sorted(unknown))}", "invalid_request_error")
+	config.update(changes)
+	if "seed" in changes:
+		rng = random.Random(config["seed"])
+	stats.clear()
+	return {"config": config}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+	body = await request.json()
+	messages = body.get("messages") or []
+	if not messages:
+		return _error(400, "'messages' is required", "invalid_request_error")
+	stats["requests"] += 1
+
+	if config["error_rate"] and rng.random() < config["error_rate"]:
+		status = int(rng.choice(str(config["error_codes"]).split(",")))
+		stats[f"injected_{status}"] += 1
+		return _error(status, f"Injected error ({status})", "rate_limit_exceeded" if status == 429 else "server_error")
+
+	slots = _get_slots()
+	if slots is not None:
+		try:
+			await asyncio.wait_for(slots.acquire(), timeout=config["queue_timeout_s"])
+		except asyncio.TimeoutError:
+			stats["rejected_busy"] += 1
+			return _error(429, "Too many concurrent requests", "rate_limit_exceeded")
+
+	try:
+		model = body.get("model", "gpt-4o")
+		n = int(body.get("n") or 1)
+		response_format = body.get("response_format")
+		request_rng = random.Random(body["seed"]) if body.get("seed") is not None else random.Random(rng.random())
+		texts = [_completion_text(messages, response_format, request_rng) for _ in range(n)]
+		prompt_tokens = _count_tokens("".join(m.get("content") or "" for m in messages))
+		completion_tokens = sum(_count_tokens(t) for t in texts)
+		usage = {
+			"prompt_tokens": prompt_tokens,
+			"completion_tokens": completion_tokens,
+			"total_tokens": prompt_tokens + completion_tokens,
+			"prompt_tokens_details": {"cached_tokens": _cached_tokens(messages, prompt_tokens)},
+		}
+		completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:24]}"
+		created = int(time.time())
+		await asyncio.sleep(_sample_ms(config["ttft_ms"]))
+	except BaseException:
+		if slots is not None:
+			slots.release()
+		raise
+
+	if not body.get("stream"):
+		try:
+			if config["tokens_per_s"] > 0:
+				await asyncio.sleep(max(_count_tokens(t) for t in texts) / config["tokens_per_s"])
+		finally:
+			if slots is not None:
+				slots.release()
+		stats["completed"] += 1
+		return {
+			"id": completion_id,
+			"object": "chat.completion",
+			"created": created,
+			"model": model,
+			"choices": [
+				{"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+				for i, text in enumerate(texts)
+			],
+			"usage": usage,
+		}
+
+	include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+	def _chunk(choices, chunk_usage=None):
+		chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+		if include_usage:
+			chunk["usage"] = chunk_usage
+		return f"data: {json.dumps(chunk)}\n\n"
+
+	released = False
+
+	def _release():
+		nonlocal released
+		if slots is not None and not released:
+			released = True
+			slots.release()
+
+	async def _events():
+		try:
+			yield _chunk([{"index": i, "delta": {"role": "assistant", "content": ""}, "finish_reason": None} for i in range(n)])
+			token_lists = [_stream_tokens(t) for t in texts]
+			for position in range(max(len(tokens) for tokens in token_lists)):
+				yield _chunk([
+					{"index": i, "delta": {"content": tokens[position]}, "finish_reason": None}
+					for i, tokens in enumerate(token_lists) if position < len(tokens)
+				])
+				if config["tokens_per_s"] > 0:
+					await asyncio.sleep(1 / config["tokens_per_s"])
+			yield _chunk([{"index": i, "delta": {}, "finish_reason": "stop"} for i in range(n)])
+			if include_usage:
+				yield _chunk([], usage)
+			yield "data: [DONE]\n\n"
+			stats["completed"] += 1
+		finally:
+			# Also runs when the client disconnects mid-stream
+			_release()
+
+	# In case the stream is never started
+	return StreamingResponse(_events(), media_type="text/event-stream", background=BackgroundTask(_release))
+
+# -------------------------
+# Outline service
+# -------------------------
+
+_shared_llm_client = None
+response_cache = ResponseCache(
+	os.environ.get("OUTLINE_RESPONSE_CACHE", os.path.join(".outline_cache", "responses.sqlite3"))
+)
+usage_ledger = UsageLedger(log_path=os.environ.get("OUTLINE_SERVICE_USAGE_LOG"))
+retry_policy = RetryPolicy(max_retries=int(os.environ.get("OUTLINE_SERVICE_MAX_RETRIES", "4")))
+hedge_policy = HedgePolicy(percentile=0.95) if os.environ.get("OUTLINE_SERVICE_HEDGE") == "1" else None
+if os.environ.get("OUTLINE_OTEL") == "1":
+	enable_opentelemetry(service_name="outline-service")
+
+
+def _llm_client():
+	"""AsyncOpenAI client shared by every request in this worker (created on first use)."""
+	global _shared_llm_client
+	if _shared_llm_client is None:
+		max_connections = int(os.environ.get("OUTLINE_SERVICE_MAX_CONNECTIONS", "100"))
+		_shared_llm_client = AsyncOpenAI(max_retries=0, http_client=httpx.AsyncClient(
+			limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+			timeout=httpx.Timeout(120, connect=10),
+		))
+	return _shared_llm_client
+
+
+class OutlineOptions(BaseModel):
+	model: str = "gpt-4o"
+	temperature: float = 0.8
+	structured: bool = False
+	use_cache: bool = True
+	# More than one returns {"candidates": [...]} with that many alternative outlines
+	candidates: int = Field(1, ge=1, le=8)
+
+
+class GenerateRequest(OutlineOptions):
+	material: str
+	beats_per_act: int = Field(3, ge=1, le=20)
+
+
+class RegenerateRequest(GenerateRequest):
+	current_outline: str
+	instructions: str
+
+
+class RegenerateActRequest(GenerateRequest):
+	current_outline: str
+	act: int = Field(ge=1, le=3)
+
+
+class ExportRequest(BaseModel):
+	format: Literal["PDF", "DOCX", "TXT"]
+	title: str
+	story_summary: str
+	outline_text: str
+
+
+async def _outline(kind, request):
+	prompt = build_prompt(kind, request.model_dump(exclude=set(OutlineOptions.model_fields)))
+	llm = AsyncLLMClient(
+		_llm_client(), request.model, request.temperature, response_cache, usage_ledger,
+		retry_policy=retry_policy, hedge_policy=hedge_policy
+	)
+	try:
+		if request.candidates > 1:
+			outlines = await llm.request_outline_candidates(
+				prompt, request.candidates, prompt.acts, request.structured, call_type=prompt.call_type
+			)
+			return {"candidates": [{"act1": o.act1, "act2": o.act2, "act3": o.act3} for o in outlines]}
+		outline = await llm.request_outline(
+			prompt, prompt.acts, request.structured, call_type=prompt.call_type, use_cache=request.use_cache
+		)
+	except APIError as e:
+		raise HTTPException(status_code=502, detail=f"LLM provider error: {e}")
+	return {"act1": outline.act1, "act2": outline.act2, "act3": outline.act3}
+
+@app.post("/api/v1/outlines/generate")
+async def generate_outline(request: GenerateRequest):
+	return await _outline("generate", request)
+
+@app.post("/api/v1/outlines/regenerate")
+async def regenerate_outline(request: RegenerateRequest):
+	return await _outline("regenerate", request)
+
+@app.post("/api/v1/outlines/regenerate-act")
+async def regenerate_act(request: RegenerateActRequest):
+	return await _outline("regenerate-act", request)
+
+@app.post("/api/v1/outlines/export")
+async def export_outline(request: ExportRequest):
+	try:
+		# PDF/DOCX rendering is CPU-bound; keep it off the event loop
+		data = await run_in_threadpool(export_document, request.format, request.title, request.story_summary, request.outline_text)
+	except ImportError as e:
+		raise HTTPException(status_code=501, detail=str(e))
+	return Response(content=data, media_type=EXPORT_MIME_TYPES[request.format])
+
+@app.get("/api/v1/usage")
+async def usage():
+	return usage_ledger.totals()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+	return Response(content=metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
-	uvicorn.run(app, host="0.0.0.0", port=8000) #might need to change 0.0.0.0 to 127.0.0.1
+	# Workers need the app as an import string
+	uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=int(os.environ.get("OUTLINE_SERVICE_WORKERS", "1"))) #might need to change 0.0.0.0 to 127.0.0.1
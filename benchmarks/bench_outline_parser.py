@@ -0,0 +1,133 @@
+"""Throughput of outline_parser against the inline parser it replaced.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_outline_parser
+"""
+import random
+import time
+
+from outline_parser import parse_outline
+
+
+def legacy_parse_outline(text):
+    """The act splitter + parse_beats that used to live in the Generate handler."""
+    def parse_beats(text):
+        lines = text.split('\n')
+        beats = []
+        structural_keywords = ['setup', 'rising action', 'climax', 'resolution', 'climax & resolution', 'climax and resolution']
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('- **') and line.endswith('**'):
+                continue
+            if line.startswith('- '):
+                beat = line[2:].strip()
+            else:
+                beat = line
+            if beat.lower() in structural_keywords:
+                continue
+            if beat.lower().startswith('key beat'):
+                if ':' in beat:
+                    beat = beat.split(':', 1)[1].strip()
+                else:
+                    continue
+            if beat:
+                beats.append(beat)
+        return beats
+
+    act1_text, act2_text, act3_text = [], [], []
+    current_act = 0
+    for line in text.split('\n'):
+        line_lower = line.strip().lower()
+        if 'act i' in line_lower and 'act ii' not in line_lower and 'act iii' not in line_lower:
+            current_act = 1
+            continue
+        elif 'act ii' in line_lower and 'act iii' not in line_lower:
+            current_act = 2
+            continue
+        elif 'act iii' in line_lower:
+            current_act = 3
+            continue
+        if current_act == 1:
+            act1_text.append(line)
+        elif current_act == 2:
+            act2_text.append(line)
+        elif current_act == 3:
+            act3_text.append(line)
+    return parse_beats('\n'.join(act1_text)), parse_beats('\n'.join(act2_text)), parse_beats('\n'.join(act3_text))
+
+
+WORDS = ("the knight", "a botanist", "the village", "glowing plant", "betrayal", "storm", "secret",
+         "journey", "reacts in fear", "the princess", "forest", "returns home", "alliance")
+
+
+def _sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + "."
+
+
+def well_formed_outline(beats_per_act, rng):
+    lines = []
+    for header, section in (("Act I", "Setup"), ("Act II", "Rising Action"), ("Act III", "Climax & Resolution")):
+        lines += [f"- {header}", f"- {section}"]
+        lines += [f"    - Key beat {i + 1}: {_sentence(rng)}" for i in range(beats_per_act)]
+    return "\n".join(lines)
+
+
+def malformed_outline(beats_per_act, rng):
+    """Mixed markdown headers, numbering, bold lines, chatter, blank lines and
+    beats that start with "Act N" without being headers."""
+    lines = ["Sure! Here is a detailed outline for your story:", ""]
+    for header, section in (("**Act I: Setup**", "Setup"), ("### Act 2", "**Rising Action**"), ("1. ACT III -", "climax and resolution")):
+        lines += [header, section, ""]
+        for i in range(beats_per_act):
+            style = rng.randrange(6)
+            if style == 0:
+                lines.append(f"{i + 1}. {_sentence(rng)}")
+            elif style == 1:
+                lines.append(f"* **Turning point:** {_sentence(rng)}")
+            elif style == 2:
+                lines.append(f"  - Key beat {i + 1}")
+            elif style == 3:
+                lines.append(f"- **{_sentence(rng)}**")
+            elif style == 4:
+                lines.append(f"- Act {rng.choice(('1', '2', 'II', '3'))}'s promise pays off: {_sentence(rng)}")
+            else:
+                lines.append(f"        • {_sentence(rng)}")
+    lines.append("Let me know if you'd like any changes!")
+    return "\n".join(lines)
+
+
+def bench(fn, text, min_seconds=0.5):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return runs / elapsed
+
+
+def main():
+    rng = random.Random(0)
+    cases = [
+        ("well-formed, 6 beats/act", well_formed_outline(6, rng)),
+        ("well-formed, 2,000 beats/act", well_formed_outline(2000, rng)),
+        ("malformed, 6 beats/act", malformed_outline(6, rng)),
+        ("malformed, 2,000 beats/act", malformed_outline(2000, rng)),
+    ]
+    print(f"{'case':32} {'lines':>8} {'legacy lines/s':>16} {'parser lines/s':>16} {'speedup':>8} {'beats (legacy/parser)':>22}")
+    for name, text in cases:
+        n_lines = text.count("\n") + 1
+        legacy = bench(legacy_parse_outline, text) * n_lines
+        new = bench(parse_outline, text) * n_lines
+        legacy_beats = sum(map(len, legacy_parse_outline(text)))
+        outline = parse_outline(text)
+        new_beats = len(outline.act1) + len(outline.act2) + len(outline.act3)
+        print(f"{name:32} {n_lines:>8} {legacy:>16,.0f} {new:>16,.0f} {new / legacy:>7.2f}x {legacy_beats:>10}/{new_beats:<11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Startup profile of streamlit_app.py, checked against budgets.
+
+Measures, each in a fresh interpreter:
+
+- app_imports_cold_ms: the app's top-level imports on a cold start (Streamlit
+  itself is excluded; the server has imported it before the script runs)
+- app_imports_rerun_ms: the same import statements again, as every rerun
+  executes them
+- eager_heavy_imports: how many heavy optional libraries (OpenAI SDK, HTTP
+  clients, PDF/DOCX libraries, tiktoken) those imports pull in; they should
+  only be imported once their feature is used
+- first_run_ms / rerun_ms: a full first script run and a rerun through
+  Streamlit's AppTest
+
+Run from the repository root:
+
+    python -m benchmarks.profile_startup
+    python -m benchmarks.profile_startup --check
+    python -m benchmarks.profile_startup --update-budgets   # after an intended change
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budgets.json")
+
+HEAVY_MODULES = ("openai", "httpx", "requests", "reportlab", "docx", "PyPDF2", "tiktoken")
+
+_IMPORTS_PROBE = """
+import json, sys, time
+try:
+    import streamlit
+except ImportError:
+    pass
+code = compile(sys.argv[1], "<app imports>", "exec")
+start = time.perf_counter()
+exec(code, {})
+cold = time.perf_counter() - start
+start = time.perf_counter()
+exec(code, {})
+rerun = time.perf_counter() - start
+heavy = [name for name in sys.argv[2].split(",") if name in sys.modules]
+print(json.dumps({"cold": cold, "rerun": rerun, "heavy": heavy}))
+"""
+
+_APPTEST_PROBE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=60)
+start = time.perf_counter()
+app.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+print(json.dumps({"first": first, "rerun": rerun, "exceptions": [str(e.value) for e in app.exception]}))
+"""
+
+
+def app_import_source(path=APP_PATH):
+    """The app's module-level import statements, without the Streamlit import."""
+    with open(path) as f:
+        source = f.read()
+    statements = []
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Import):
+            names = [alias for alias in node.names if alias.name.split(".")[0] != "streamlit"]
+            if names:
+                statements.append(ast.unparse(ast.Import(names=names)))
+        elif isinstance(node, ast.ImportFrom) and (node.module or "").split(".")[0] != "streamlit":
+            statements.append(ast.get_source_segment(source, node))
+    return "\n".join(statements)
+
+
+def _probe(code, *args):
+    result = subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def profile(runs):
+    results = {}
+    source = app_import_source()
+    samples = [_probe(_IMPORTS_PROBE, source, ",".join(HEAVY_MODULES)) for _ in range(runs)]
+    results["app_imports_cold_ms"] = round(_median([s["cold"] for s in samples]) * 1000, 2)
+    results["app_imports_rerun_ms"] = round(_median([s["rerun"] for s in samples]) * 1000, 3)
+    results["eager_heavy_imports"] = len(samples[0]["heavy"])
+    if samples[0]["heavy"]:
+        results["eager_heavy_modules"] = samples[0]["heavy"]
+
+    try:
+        import streamlit.testing.v1  # noqa: F401
+    except ImportError:
+        results["apptest"] = "skipped: streamlit is not installed"
+        return results
+    samples = [_probe(_APPTEST_PROBE, APP_PATH) for _ in range(runs)]
+    results["first_run_ms"] = round(_median([s["first"] for s in samples]) * 1000, 1)
+    results["rerun_ms"] = round(_median([s["rerun"] for s in samples]) * 1000, 1)
+    if samples[0]["exceptions"]:
+        results["apptest_exceptions"] = samples[0]["exceptions"]
+    return results
+
+
+def check(results, budgets):
+    """Measurements over their budget, and budgeted ones that could not be measured."""
+    over = [f"{metric}: not measured" for metric in budgets if metric not in results]
+    over += [f"apptest: {error}" for error in results.get("apptest_exceptions", [])]
+    return over + [
+        f"{metric}: {results[metric]} > {budget}"
+        for metric, budget in budgets.items()
+        if metric in results and results[metric] > budget
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement (the median is reported)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--budgets", default=BUDGETS_PATH)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if a measurement is over budget")
+    parser.add_argument("--update-budgets", action="store_true", help="rewrite the budgets from these results")
+    parser.add_argument("--headroom", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    results = profile(args.runs)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+    if args.update_budgets:
+        for metric, value in results.items():
+            if metric == "eager_heavy_imports":
+                budgets[metric] = 0
+            elif metric.endswith("_ms"):
+                budgets[metric] = round(value * args.headroom + 1, 1)
+        with open(args.budgets, "w") as f:
+            json.dump(dict(sorted(budgets.items())), f, indent=2)
+            f.write("\n")
+    elif args.check:
+        over = check(results, budgets)
+        for line in over:
+            print(f"OVER BUDGET {line}")
+        return 1 if over else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
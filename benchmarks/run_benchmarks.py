@@ -0,0 +1,415 @@
+"""Headless benchmarks of the outline pipeline, checked against regression thresholds.
+
+Drives the modules behind streamlit_app.py without a browser: upload
+extraction, prompt construction, the LLM call (against the mock LLM in
+api.py), beat parsing, version snapshots and exports, at several document
+sizes and beat counts, plus a "rerun" case chaining them the way one
+Generate run does. Every case reports latency percentiles and peak Python
+memory.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --output results.json --check
+    python -m benchmarks.run_benchmarks --update-thresholds   # after an intended change
+
+The mock LLM is started on a free port unless --base-url points at one
+that is already running. Cases whose optional dependencies (reportlab,
+python-docx, PyPDF2, openai, fastapi) are missing are reported as skipped;
+a case that raises is reported as an error and fails --check.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timezone
+
+from benchmarks.bench_outline_parser import well_formed_outline
+from exports import export_document
+from extraction import DOCX_MIME, PDF_MIME, TXT_MIME, extract_text
+from outline_diff import act_diff_html, diff_outlines
+from outline_parser import format_outline, parse_outline
+from prompts import generate_outline_prompt, regenerate_act_prompt
+from version_store import VersionStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+# Story material sizes in characters
+DOC_SIZES = {"small": 5_000, "medium": 50_000, "large": 500_000}
+BEAT_COUNTS = (2, 3, 4, 5, 6)
+VERSIONS_PER_SESSION = 100
+
+WORDS = ("the knight", "a botanist", "the village", "glowing plant", "betrayal", "storm", "secret",
+         "journey", "reacts in fear", "the princess", "forest", "returns home", "alliance")
+
+
+class Skipped(Exception):
+    """Raised by a case's setup when it cannot run here."""
+
+
+def story_text(chars, rng):
+    paragraphs = []
+    size = 0
+    while size < chars:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + "."
+                     for _ in range(rng.randint(3, 8))]
+        paragraphs.append(" ".join(sentences))
+        size += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def _export(export_format, title, summary, outline_text):
+    try:
+        return export_document(export_format, title, summary, outline_text)
+    except ImportError as e:
+        raise Skipped(str(e))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class MockLLM:
+    """The mock LLM from api.py in a subprocess, with no simulated latency."""
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self.process = None
+
+    def start(self):
+        if self.base_url is not None:
+            return
+        port = _free_port()
+        env = dict(os.environ, MOCK_TTFT_MS="fixed:0", MOCK_TOKENS_PER_S="0", MOCK_MAX_CONCURRENCY="0", MOCK_SEED="0")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self.base_url = f"http://127.0.0.1:{port}/v1"
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                error = self.process.stderr.read().decode("utf-8", "replace").strip().splitlines()
+                code = self.process.returncode
+                self.process = None
+                self.base_url = None
+                raise Skipped(f"mock LLM did not start: {error[-1] if error else f'exit code {code}'}")
+            try:
+                urllib.request.urlopen(f"{self.base_url}/models", timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise Skipped("mock LLM did not start within 20s")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+class Pipeline:
+    """Inputs shared by the cases, built once (and lazily, for the expensive ones)."""
+
+    def __init__(self, mock, seed=0):
+        self.mock = mock
+        self.rng = random.Random(seed)
+        self.stories = {size: story_text(chars, self.rng) for size, chars in DOC_SIZES.items()}
+        self.outlines = {beats: well_formed_outline(beats, self.rng) for beats in BEAT_COUNTS}
+        self._documents = {}
+        self._llm = None
+        self._mock_error = None
+
+    def document(self, mime_type, size):
+        """An uploaded file of the given type holding the story of the given size."""
+        key = (mime_type, size)
+        if key not in self._documents:
+            story = self.stories[size]
+            if mime_type == TXT_MIME:
+                data = story.encode("utf-8")
+            elif mime_type == PDF_MIME:
+                data = _export("PDF", "Benchmark", story, "")
+            else:
+                data = _export("DOCX", "Benchmark", story, "")
+            self._documents[key] = data
+        return self._documents[key]
+
+    def llm(self):
+        if self._llm is None:
+            if self._mock_error is not None:
+                raise Skipped(self._mock_error)
+            try:
+                from openai import OpenAI
+
+                from llm import LLMClient
+            except ImportError as e:
+                raise Skipped(str(e))
+            try:
+                self.mock.start()
+            except Skipped as e:
+                self._mock_error = str(e)
+                raise
+            # No response cache, so every run reaches the mock
+            self._llm = LLMClient(OpenAI(base_url=self.mock.base_url, api_key="mock", max_retries=0), "gpt-4o", 0.7)
+        return self._llm
+
+
+def _versions_session(outline_beats):
+    """A session's worth of snapshots, each editing one beat of the previous version."""
+    acts = [list(outline_beats.act1), list(outline_beats.act2), list(outline_beats.act3)]
+    store = VersionStore()
+    for i in range(VERSIONS_PER_SESSION):
+        act = acts[i % 3]
+        act[i % len(act)] = f"{act[i % len(act)]} (edit {i})"
+        store.append(*acts, timestamp=f"2024-01-01 00:00:{i % 60:02d}")
+    return store
+
+
+def build_cases(pipeline):
+    """{name: setup}, where setup() returns the function to time or raises Skipped."""
+    cases = {}
+
+    for size in DOC_SIZES:
+        for mime_type, name in ((TXT_MIME, "txt"), (PDF_MIME, "pdf"), (DOCX_MIME, "docx")):
+            def setup(mime_type=mime_type, size=size):
+                data = pipeline.document(mime_type, size)
+                try:
+                    extract_text(data, mime_type)
+                except ImportError as e:
+                    raise Skipped(str(e))
+                return lambda: extract_text(data, mime_type)
+            cases[f"extract/{name}/{size}"] = setup
+
+        def setup(size=size):
+            story = pipeline.stories[size]
+            return lambda: generate_outline_prompt(story, 4).messages()
+        cases[f"prompt/generate/{size}"] = setup
+
+    for beats in BEAT_COUNTS:
+        outline_text = pipeline.outlines[beats]
+        outline = parse_outline(outline_text)
+
+        def setup(outline_text=outline_text):
+            return lambda: parse_outline(outline_text)
+        cases[f"parse/{beats}-beats"] = setup
+
+        def setup(outline_text=outline_text, beats=beats):
+            story = pipeline.stories["medium"]
+            return lambda: regenerate_act_prompt(story, outline_text, 2, beats).messages()
+        cases[f"prompt/regenerate-act/{beats}-beats"] = setup
+
+        def setup(beats=beats):
+            llm = pipeline.llm()
+            prompt = generate_outline_prompt(pipeline.stories["small"], beats)
+            return lambda: llm.request_outline(prompt, call_type=prompt.call_type, use_cache=False)
+        cases[f"llm/generate/{beats}-beats"] = setup
+
+        def setup(outline=outline):
+            return lambda: _versions_session(outline)
+        cases[f"versions/{VERSIONS_PER_SESSION}-snapshots/{beats}-beats"] = setup
+
+        def setup(outline=outline):
+            store = _versions_session(outline)
+            return lambda: [store[i] for i in range(len(store))]
+        cases[f"versions/read-all/{beats}-beats"] = setup
+
+        def setup(outline=outline):
+            # What the history panel reads per rerun: one page of labels and one preview
+            store = _versions_session(outline)
+            return lambda: (store.metadata(len(store) - 10), store.get_acts(len(store) // 2))
+        cases[f"versions/history-page/{beats}-beats"] = setup
+
+        def setup(outline=outline):
+            # Oldest against newest version of a session, uncached, plus the highlighted rendering
+            store = _versions_session(outline)
+            old, new = (tuple(map(tuple, store.get_acts(i))) for i in (0, -1))
+
+            def diff():
+                diff_outlines.cache_clear()
+                return [act_diff_html(act) for act in diff_outlines(old, new)]
+            return diff
+        cases[f"diff/oldest-newest/{beats}-beats"] = setup
+
+        for export_format in ("PDF", "DOCX", "TXT"):
+            def setup(export_format=export_format, outline=outline):
+                text = format_outline(outline.act1, outline.act2, outline.act3)
+                summary = pipeline.stories["small"][:500]
+                _export(export_format, "Benchmark", summary, text)
+                return lambda: _export(export_format, "Benchmark", summary, text)
+            cases[f"export/{export_format.lower()}/{beats}-beats"] = setup
+
+        def setup(beats=beats):
+            # What one non-streamed Generate run does end to end
+            llm = pipeline.llm()
+            data = pipeline.document(TXT_MIME, "medium")
+
+            def rerun():
+                story = extract_text(data, TXT_MIME)
+                prompt = generate_outline_prompt(story, beats)
+                result = llm.request_outline(prompt, call_type=prompt.call_type, use_cache=False)
+                versions = VersionStore()
+                versions.append(result.act1, result.act2, result.act3)
+                export_document("TXT", "Benchmark", story[:500], format_outline(result.act1, result.act2, result.act3))
+            return rerun
+        cases[f"rerun/generate/{beats}-beats"] = setup
+
+    return cases
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(fn, repeat, warmup=1):
+    """Latency over `repeat` runs (ms), and peak traced memory of one more run (KiB)."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    # Traced separately: tracemalloc slows allocation-heavy code down a lot
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    ordered = sorted(times)
+    return {
+        "runs": repeat,
+        "mean_ms": round(sum(times) / len(times), 4),
+        "p50_ms": round(_percentile(ordered, 0.50), 4),
+        "p95_ms": round(_percentile(ordered, 0.95), 4),
+        "max_ms": round(ordered[-1], 4),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(cases, repeat, pattern=None):
+    results = {}
+    for name, setup in cases.items():
+        if pattern and pattern not in name:
+            continue
+        try:
+            results[name] = measure(setup(), repeat)
+        except Skipped as e:
+            results[name] = {"skipped": str(e)}
+        except Exception as e:
+            # One broken case shouldn't stop the others from being measured
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def check(results, thresholds):
+    """Descriptions of every metric above its threshold, every case that
+    raised and every case that ran without a threshold."""
+    regressions = []
+    for name, result in results.items():
+        if "error" in result:
+            regressions.append(f"{name}: error {result['error']}")
+        elif "skipped" not in result and name not in thresholds:
+            regressions.append(f"{name}: no threshold (record one with --update-thresholds)")
+    for name, limits in thresholds.items():
+        result = results.get(name)
+        if result is None or "skipped" in result or "error" in result:
+            continue
+        for metric, limit in limits.items():
+            if result[metric] > limit:
+                regressions.append(f"{name}: {metric} {result[metric]} > {limit}")
+    return regressions
+
+
+def thresholds_from(results, time_headroom, memory_headroom, time_floor_ms, previous=None):
+    """Thresholds a little above `results`; cases that did not run keep their previous ones.
+
+    Latency is checked on the median: with a few dozen runs the p95 is
+    close to the slowest run and mostly measures scheduler noise. Short
+    cases are noise too, so their threshold is at least `time_floor_ms`
+    above the measured median.
+    """
+    thresholds = dict(previous or {})
+    for name, result in results.items():
+        if "skipped" not in result and "error" not in result:
+            thresholds[name] = {
+                "p50_ms": round(max(result["p50_ms"] * time_headroom, result["p50_ms"] + time_floor_ms), 3),
+                "peak_kib": round(result["peak_kib"] * memory_headroom, 1),
+            }
+    return dict(sorted(thresholds.items()))
+
+
+def print_results(results):
+    print(f"{'case':42} {'p50 ms':>10} {'p95 ms':>10} {'peak KiB':>10}")
+    for name, result in results.items():
+        if "skipped" in result:
+            print(f"{name:42} skipped: {result['skipped']}")
+        elif "error" in result:
+            print(f"{name:42} error: {result['error']}")
+        else:
+            print(f"{name:42} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {result['peak_kib']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("-k", dest="pattern", help="only run cases whose name contains this")
+    parser.add_argument("--base-url", help="mock LLM to use instead of starting one (e.g. http://127.0.0.1:8000/v1)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if a case exceeds or has no threshold")
+    parser.add_argument("--update-thresholds", action="store_true", help="rewrite the thresholds from these results")
+    parser.add_argument("--time-headroom", type=float, default=2.0)
+    parser.add_argument("--memory-headroom", type=float, default=1.25)
+    parser.add_argument("--time-floor-ms", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    mock = MockLLM(args.base_url)
+    try:
+        results = run(build_cases(Pipeline(mock)), args.repeat, args.pattern)
+    finally:
+        mock.stop()
+
+    print_results(results)
+    report = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    previous = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            previous = json.load(f)
+    if args.update_thresholds:
+        with open(args.thresholds, "w") as f:
+            json.dump(thresholds_from(results, args.time_headroom, args.memory_headroom, args.time_floor_ms, previous), f, indent=2)
+            f.write("\n")
+    elif args.check:
+        regressions = check(results, previous)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+from io import BytesIO
+
+from instrumentation import span
+
+# Outline exports, shared by the Streamlit app and the outline service
+
+EXPORT_MIME_TYPES = {
+    "PDF": "application/pdf",
+    "DOCX": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "TXT": "text/plain",
+}
+
+
+@span("export.pdf")
+def create_pdf_document(title, story_summary, outline_text):
+    """Create a PDF document with proper formatting."""
+    try:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT
+        
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter,
+                                rightMargin=inch, leftMargin=inch,
+                                topMargin=inch, bottomMargin=inch)
+        
+        story = []
+        styles = getSampleStyleSheet()
+        
+        # Title style
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=14,
+            fontName='Times-Roman',
+            alignment=TA_CENTER,
+            spaceAfter=12
+        )
+        
+        # Body style - double spaced
+        body_style = ParagraphStyle(
+            'CustomBody',
+            parent=styles['BodyText'],
+            fontSize=12,
+            fontName='Times-Roman',
+            leading=24,  # Double spacing (2 * 12pt)
+            alignment=TA_LEFT
+        )
+        
+        # Add title
+        story.append(Paragraph(title, title_style))
+        story.append(Spacer(1, 0.2*inch))
+        
+        # Add story summary
+        story.append(Paragraph(f"<b>Story Summary:</b> {story_summary}", body_style))
+        story.append(Spacer(1, 0.3*inch))
+        
+        # Add outline
+        for line in outline_text.split('\n'):
+            if line.strip():
+                story.append(Paragraph(line, body_style))
+                story.append(Spacer(1, 0.1*inch))
+        
+        doc.build(story)
+        buffer.seek(0)
+        return buffer
+    except ImportError as e:
+        raise ImportError("PDF generation requires reportlab. Install with: pip install reportlab") from e
+
+@span("export.docx")
+def create_docx_document(title, story_summary, outline_text):
+    """Create a DOCX document with proper formatting."""
+    try:
+        from docx import Document
+        from docx.shared import Pt, Inches
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+        
+        doc = Document()
+        
+        # Set default font
+        style = doc.styles['Normal']
+        font = style.font
+        font.name = 'Times New Roman'
+        font.size = Pt(12)
+        
+        # Set paragraph spacing for double-spacing
+        paragraph_format = style.paragraph_format
+        paragraph_format.line_spacing = 2.0
+        
+        # Add title
+        title_para = doc.add_paragraph(title)
+        title_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        title_run = title_para.runs[0]
+        title_run.font.size = Pt(14)
+        title_run.font.bold = True
+        
+        doc.add_paragraph()  # Blank line
+        
+        # Add story summary
+        summary_para = doc.add_paragraph()
+        summary_para.add_run('Story Summary: ').bold = True
+        summary_para.add_run(story_summary)
+        
+        doc.add_paragraph()  # Blank line
+        
+        # Add outline
+        for line in outline_text.split('\n'):
+            if line.strip():
+                doc.add_paragraph(line)
+        
+        buffer = BytesIO()
+        doc.save(buffer)
+        buffer.seek(0)
+        return buffer
+    except ImportError as e:
+        raise ImportError("DOCX generation requires python-docx. Install with: pip install python-docx") from e
+
+@span("export.txt")
+def create_txt_document(title, story_summary, outline_text):
+    """Create a plain text document."""
+    content = f"{title}\n{'='*len(title)}\n\n"
+    content += f"Story Summary: {story_summary}\n\n"
+    content += outline_text
+    return content
+
+
+def export_document(export_format, title, story_summary, outline_text) -> bytes:
+    """File contents of an outline export ("PDF", "DOCX" or "TXT").
+
+    Raises ImportError if the library for the format is not installed.
+    """
+    if export_format == "PDF":
+        return create_pdf_document(title, story_summary, outline_text).getvalue()
+    if export_format == "DOCX":
+        return create_docx_document(title, story_summary, outline_text).getvalue()
+    return create_txt_document(title, story_summary, outline_text).encode("utf-8")
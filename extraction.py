@@ -0,0 +1,138 @@
+import codecs
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TXT_MIME = "text/plain"
+
+
+def file_digest(data: bytes) -> str:
+    """Content hash used as the cache key for an uploaded file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+# Rough conversion used when the extraction budget is given in tokens
+CHARS_PER_TOKEN = 4
+TXT_BLOCK_SIZE = 64 * 1024
+
+
+def iter_document_parts(data: bytes, mime_type: str):
+    """Yield (text, fraction_done) for each page, paragraph or text block of a document.
+
+    Parts carry their own separators, so joining them gives the full text.
+    """
+    if mime_type == TXT_MIME:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        stream = BytesIO(data)
+        total = max(len(data), 1)
+        while True:
+            block = stream.read(TXT_BLOCK_SIZE)
+            final = not block
+            text = decoder.decode(block, final=final)
+            if text:
+                yield text, stream.tell() / total
+            if final:
+                return
+
+    elif mime_type == PDF_MIME:
+        import PyPDF2
+        # PdfReader only parses a page when it is accessed
+        reader = PyPDF2.PdfReader(BytesIO(data))
+        total = max(len(reader.pages), 1)
+        for i, page in enumerate(reader.pages):
+            text = page.extract_text() or ""
+            yield (text if i == 0 else "\n" + text), (i + 1) / total
+
+    elif mime_type == DOCX_MIME:
+        import docx
+        # python-docx loads the whole document body up front; paragraphs are
+        # still handed out one at a time so the caller can stop early.
+        doc = docx.Document(BytesIO(data))
+        paragraphs = doc.paragraphs
+        total = max(len(paragraphs), 1)
+        for i, p in enumerate(paragraphs):
+            yield (p.text if i == 0 else "\n" + p.text), (i + 1) / total
+
+
+def iter_extracted_text(data: bytes, mime_type: str, max_chars=None, max_tokens=None):
+    """Yield (chunk, fraction_done) until the document ends or the budget is spent."""
+    if max_tokens is not None:
+        token_chars = max_tokens * CHARS_PER_TOKEN
+        max_chars = token_chars if max_chars is None else min(max_chars, token_chars)
+
+    produced = 0
+    for text, fraction in iter_document_parts(data, mime_type):
+        if max_chars is not None and produced + len(text) >= max_chars:
+            yield text[:max_chars - produced], 1.0
+            return
+        produced += len(text)
+        yield text, fraction
+
+
+def extract_text(data: bytes, mime_type: str, max_chars=None, max_tokens=None) -> str:
+    """Extract plain text from the raw bytes of an uploaded PDF, DOCX or TXT file."""
+    return "".join(chunk for chunk, _ in iter_extracted_text(data, mime_type, max_chars, max_tokens))
+
+
+class ExtractionCache:
+    """Bounded LRU of extracted document text, keyed on the file digest.
+
+    When `disk_dir` is set, entries are also written there as `<key>.txt` so
+    extraction survives process restarts; evicting from memory leaves the disk
+    copy in place.
+    """
+
+    def __init__(self, max_entries=16, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        text = None
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                text = f.read()
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, text)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._store(key, text)
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def _store(self, key, text):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+# Timing spans for the hot paths (LLM calls, upload extraction, exports,
+# beat parsing, version snapshots). Every span's duration is kept in a
+# process-wide registry, summarized as p50/p95 and exported as Prometheus
+# text; with OpenTelemetry enabled, spans are also sent to a collector.
+
+
+class Metrics:
+    """Recent durations per span name, plus running counts and totals.
+
+    Percentiles are computed over the last `window` samples of each span so
+    they follow the current behaviour rather than the whole process lifetime.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+        self._totals = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+                self._totals[name] = 0.0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+            self._totals[name] += seconds
+
+    def _snapshot(self):
+        with self._lock:
+            return {name: (sorted(samples), self._counts[name], self._totals[name])
+                    for name, samples in sorted(self._samples.items())}
+
+    def summary(self):
+        """{name: {'count', 'total_s', 'p50_ms', 'p95_ms', 'max_ms'}}, sorted by name."""
+        return {
+            name: {
+                'count': count,
+                'total_s': round(total, 4),
+                'p50_ms': round(_percentile(ordered, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+            for name, (ordered, count, total) in self._snapshot().items()
+        }
+
+    def prometheus_text(self, metric="outline_span_seconds"):
+        """The p50/p95, sum and count of every span in the Prometheus text exposition format."""
+        lines = [f"# HELP {metric} Duration of instrumented spans.", f"# TYPE {metric} summary"]
+        for name, (ordered, count, total) in self._snapshot().items():
+            for quantile in (0.5, 0.95):
+                lines.append(f'{metric}{{span="{name}",quantile="{quantile}"}} {_percentile(ordered, quantile):.9f}')
+            lines.append(f'{metric}_sum{{span="{name}"}} {total:.9f}')
+            lines.append(f'{metric}_count{{span="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+metrics = Metrics()
+_tracer = None
+
+
+class span(ContextDecorator):
+    """Time a block (`with span("name"):`) or every call of a function (`@span("name")`).
+
+    Works in async code as a context manager, not as a decorator.
+    """
+
+    def __init__(self, name, registry=None):
+        self.name = name
+        self.registry = registry or metrics
+        self._start = None
+        self._otel = None
+
+    def _recreate_cm(self):
+        # One instance per call, so a decorated function can run on several threads
+        return span(self.name, self.registry)
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(self.name)
+            self._otel.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self._start)
+        if self._otel is not None:
+            self._otel.__exit__(*exc_info)
+        return False
+
+
+def enable_opentelemetry(endpoint=None, service_name="dynamic-outline"):
+    """Also send spans to an OTLP/HTTP collector; returns False if the SDK is not installed.
+
+    `endpoint` defaults to OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or a collector
+    on localhost.
+    """
+    global _tracer
+    if _tracer is not None:
+        return True
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return False
+    endpoint = endpoint or os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "http://localhost:4318/v1/traces")
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("instrumentation")
+    return True
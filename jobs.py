@@ -0,0 +1,147 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """A unit of background work and its outcome.
+
+    `fn(job)` may call `job.set_progress(...)` and should stop early when
+    `job.cancelled` becomes true; a result produced after cancellation is
+    discarded.
+    """
+
+    def __init__(self, key, label):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.label = label
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.subscribers = set()
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.created_at
+
+    def set_progress(self, message):
+        self.progress = message
+
+
+class JobQueue:
+    """In-process worker pool for long-running requests such as LLM calls.
+
+    Jobs outlive the script run (or HTTP request) that submitted them and
+    are looked up by id. Submitting a job whose `key` matches one that is
+    still queued or running returns that job instead of starting another,
+    so repeated clicks and identical requests from several users share one
+    call. Each submitter passes a `subscriber` id (e.g. a session id); a
+    shared job is only cancelled once every subscriber has cancelled it,
+    and submitting again from the same subscriber doesn't count twice.
+    The last `keep_finished` finished jobs stay available for polling.
+    """
+
+    def __init__(self, max_workers=4, keep_finished=200):
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="outline-job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._futures = {}
+
+    def submit(self, fn, key=None, label="", subscriber=None):
+        subscriber = subscriber or uuid.uuid4().hex
+        with self._lock:
+            if key is not None and key in self._in_flight:
+                job = self._in_flight[key]
+                job.subscribers.add(subscriber)
+                return job
+            job = Job(key, label)
+            job.subscribers.add(subscriber)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job
+            self._futures[job.id] = self._executor.submit(self._run, job, fn)
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, subscriber=None):
+        """Withdraw `subscriber` (all of them if None); returns True if the job itself was cancelled."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            if subscriber is None:
+                job.subscribers.clear()
+            else:
+                job.subscribers.discard(subscriber)
+            if job.subscribers:
+                return False
+            job._cancel.set()
+            future = self._futures.get(job_id)
+            # Queued jobs never start; running ones are abandoned
+            if future is not None:
+                future.cancel()
+            self._finish(job, CANCELLED)
+            return True
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def _run(self, job, fn):
+        with self._lock:
+            if job.cancelled:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            result = fn(job)
+        except Exception as e:
+            with self._lock:
+                if not job.cancelled:
+                    job.error = e
+                    self._finish(job, FAILED)
+            return
+        with self._lock:
+            if not job.cancelled:
+                job.result = result
+                self._finish(job, DONE)
+
+    def _finish(self, job, status):
+        # Called with the lock held
+        job.status = status
+        job.finished_at = time.time()
+        self._futures.pop(job.id, None)
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+        finished = [job_id for job_id, j in self._jobs.items() if j.done]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
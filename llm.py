@@ -0,0 +1,330 @@
+import asyncio
+import time
+
+from instrumentation import metrics, span
+from llm_cache import cache_key
+from outline_parser import ThreeActOutline, outline_json_schema, parse_act, parse_outline, parse_outline_json
+from parallel import run_parallel
+from retry import call_hedged, call_hedged_async, call_with_retries, call_with_retries_async
+from token_accounting import estimate_tokens
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens the provider served from its prompt cache, if it reports them."""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def outline_from_text(text, max_beats, acts=(1, 2, 3)) -> ThreeActOutline:
+    """Beats of a plain-text outline response, capped to `max_beats` per act."""
+    if len(acts) == 1:
+        outline = ThreeActOutline()
+        outline.beats(acts[0]).extend(parse_act(text, acts[0]))
+        return outline.truncated(max_beats)
+    return parse_outline(text).truncated(max_beats)
+
+
+def outline_response_format(max_beats, acts=(1, 2, 3)):
+    return {"type": "json_schema", "json_schema": outline_json_schema(max_beats, acts)}
+
+
+def _bad_request_error():
+    # The SDK is imported by the client; this module doesn't need it until a request fails
+    from openai import BadRequestError
+    return BadRequestError
+
+
+def _choice_texts(completion):
+    return [choice.message.content for choice in sorted(completion.choices, key=lambda c: c.index)]
+
+
+class _BaseLLMClient:
+    """Chat completions through the response cache, recorded in the usage ledger.
+
+    `client` is an (Async)OpenAI client and is meant to be shared; these
+    wrappers are cheap and can be made per request with a different model
+    or temperature. A function returning the client may be passed instead,
+    to create it (and import the SDK) only when the first request is made.
+    Requests are retried according to `retry_policy`, and non-streamed ones
+    are hedged according to `hedge_policy` (see retry.py).
+    """
+
+    def __init__(self, client, model, temperature, response_cache=None, usage_ledger=None,
+                 retry_policy=None, hedge_policy=None):
+        self._client = client
+        self.model = model
+        self.temperature = temperature
+        self.response_cache = response_cache
+        self.usage_ledger = usage_ledger
+        self.retry_policy = retry_policy
+        self.hedge_policy = hedge_policy
+
+    @property
+    def client(self):
+        if not hasattr(self._client, "chat"):
+            self._client = self._client()
+        return self._client
+
+    def _estimate(self, messages):
+        return estimate_tokens("".join(m["content"] for m in messages), self.model)
+
+    def _cached(self, key, call_type, estimated, use_cache):
+        if not use_cache or self.response_cache is None:
+            return None
+        cached = self.response_cache.get(key)
+        if cached is not None and self.usage_ledger is not None:
+            self.usage_ledger.record(call_type, self.model, estimated, cache_hit=True)
+        return cached
+
+    def _store(self, key, result):
+        if self.response_cache is not None:
+            self.response_cache.put(key, result)
+
+    def _record(self, call_type, estimated, usage, start, **extra):
+        if self.usage_ledger is not None:
+            self.usage_ledger.record(
+                call_type, self.model, estimated,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                cached_tokens=cached_prompt_tokens(usage),
+                latency_s=time.perf_counter() - start,
+                **extra
+            )
+
+    def _request(self, messages, response_format):
+        extra = {"response_format": response_format} if response_format else {}
+        return dict(model=self.model, messages=messages, temperature=self.temperature, **extra)
+
+
+class LLMClient(_BaseLLMClient):
+    """Blocking client, used by the Streamlit app when it calls the provider itself."""
+
+    def complete(self, messages, timeout=None, response_format=None, call_type="other", use_cache=True) -> str:
+        estimated = self._estimate(messages)
+        key = cache_key(messages, self.model, self.temperature, response_format)
+        cached = self._cached(key, call_type, estimated, use_cache)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        request_client = self.client.with_options(timeout=timeout) if timeout else self.client
+        request = self._request(messages, response_format)
+        with span("llm.complete"):
+            completion, hedged = call_hedged(
+                lambda: call_with_retries(lambda: request_client.chat.completions.create(**request), self.retry_policy),
+                self.hedge_policy
+            )
+        result = completion.choices[0].message.content
+        self._record(call_type, estimated, completion.usage, start, hedged=hedged)
+        self._store(key, result)
+        return result
+
+    def stream(self, messages, call_type="other", use_cache=True):
+        """Same request as complete(), but yields the completion text as it arrives."""
+        estimated = self._estimate(messages)
+        key = cache_key(messages, self.model, self.temperature)
+        cached = self._cached(key, call_type, estimated, use_cache)
+        if cached is not None:
+            yield cached
+            return
+
+        start = time.perf_counter()
+        # Only opening the stream is retried; a stream that breaks midway is not replayed
+        stream = call_with_retries(lambda: self.client.chat.completions.create(
+            **self._request(messages, None),
+            stream=True,
+            stream_options={"include_usage": True},
+        ), self.retry_policy)
+        parts = []
+        usage = None
+        completed = False
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            completed = True
+        finally:
+            # Closing early (e.g. the user pressed Stop) drops the HTTP connection
+            stream.close()
+            metrics.observe("llm.stream", time.perf_counter() - start)
+            if self.usage_ledger is not None:
+                # Interrupted streams send no usage; count what was received
+                self.usage_ledger.record(
+                    call_type, self.model, estimated,
+                    prompt_tokens=usage.prompt_tokens if usage else estimated,
+                    completion_tokens=usage.completion_tokens if usage else estimate_tokens("".join(parts), self.model),
+                    cached_tokens=cached_prompt_tokens(usage),
+                    latency_s=time.perf_counter() - start,
+                    interrupted=not completed
+                )
+        self._store(key, "".join(parts))
+
+    def request_outline(self, prompt, acts=(1, 2, 3), structured=False, timeout=None, call_type="generate",
+                        use_cache=True) -> ThreeActOutline:
+        """Beats for `acts` from one call, capped to the prompt's beats per act.
+
+        With `structured`, the model is asked for a schema-constrained JSON
+        object; if it rejects the schema or returns something unusable, the
+        plain-text prompt is sent instead and parsed.
+        """
+        max_beats = prompt.beats_per_act
+        if structured:
+            try:
+                text = self.complete(
+                    prompt.messages(structured=True),
+                    timeout=timeout,
+                    response_format=outline_response_format(max_beats, acts),
+                    call_type=call_type,
+                    use_cache=use_cache
+                )
+                return parse_outline_json(text, acts).truncated(max_beats)
+            except (_bad_request_error(), ValueError):
+                pass
+        text = self.complete(prompt.messages(), timeout=timeout, call_type=call_type, use_cache=use_cache)
+        return outline_from_text(text, max_beats, acts)
+
+    def complete_n(self, messages, n, timeout=None, response_format=None, call_type="other") -> list[str]:
+        """`n` samples for one prompt from a single request (`n=`); never cached."""
+        estimated = self._estimate(messages)
+        start = time.perf_counter()
+        request_client = self.client.with_options(timeout=timeout) if timeout else self.client
+        request = dict(self._request(messages, response_format), n=n)
+        with span("llm.complete_n"):
+            completion, hedged = call_hedged(
+                lambda: call_with_retries(lambda: request_client.chat.completions.create(**request), self.retry_policy),
+                self.hedge_policy
+            )
+        self._record(call_type, estimated, completion.usage, start, hedged=hedged, candidates=n)
+        return _choice_texts(completion)
+
+    def request_outline_candidates(self, prompt, n, acts=(1, 2, 3), structured=False, timeout=None,
+                                   call_type="generate") -> list[ThreeActOutline]:
+        """`n` alternative outlines for one prompt.
+
+        All candidates come from one request with `n=`; if the provider
+        rejects `n`, they are requested concurrently instead. Candidates that
+        fail in the concurrent fallback are dropped.
+        """
+        max_beats = prompt.beats_per_act
+        if structured:
+            try:
+                texts = self.complete_n(
+                    prompt.messages(structured=True), n,
+                    timeout=timeout,
+                    response_format=outline_response_format(max_beats, acts),
+                    call_type=call_type
+                )
+                return [parse_outline_json(text, acts).truncated(max_beats) for text in texts]
+            except (_bad_request_error(), ValueError):
+                pass
+        try:
+            texts = self.complete_n(prompt.messages(), n, timeout=timeout, call_type=call_type)
+        except _bad_request_error():
+            outcomes = run_parallel(
+                {i: (lambda: self.complete(prompt.messages(), timeout=timeout, call_type=call_type, use_cache=False))
+                 for i in range(n)},
+                timeout=timeout
+            )
+            texts = [result for result, error in outcomes.values() if error is None]
+            if not texts:
+                raise next(error for _, error in outcomes.values())
+        return [outline_from_text(text, max_beats, acts) for text in texts]
+
+
+class AsyncLLMClient(_BaseLLMClient):
+    """asyncio client for the outline service; `client` is an AsyncOpenAI.
+
+    Token counting, the SQLite response cache and the usage log block, so
+    they run in a worker thread rather than on the event loop.
+    """
+
+    def _lookup(self, messages, response_format, call_type, use_cache):
+        estimated = self._estimate(messages)
+        key = cache_key(messages, self.model, self.temperature, response_format)
+        return estimated, key, self._cached(key, call_type, estimated, use_cache)
+
+    def _done(self, key, result, call_type, estimated, usage, start, **extra):
+        self._record(call_type, estimated, usage, start, **extra)
+        self._store(key, result)
+
+    async def complete(self, messages, timeout=None, response_format=None, call_type="other", use_cache=True) -> str:
+        estimated, key, cached = await asyncio.to_thread(self._lookup, messages, response_format, call_type, use_cache)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        request_client = self.client.with_options(timeout=timeout) if timeout else self.client
+        request = self._request(messages, response_format)
+        with span("llm.complete"):
+            completion, hedged = await call_hedged_async(
+                lambda: call_with_retries_async(lambda: request_client.chat.completions.create(**request), self.retry_policy),
+                self.hedge_policy
+            )
+        result = completion.choices[0].message.content
+        await asyncio.to_thread(self._done, key, result, call_type, estimated, completion.usage, start, hedged=hedged)
+        return result
+
+    async def request_outline(self, prompt, acts=(1, 2, 3), structured=False, timeout=None, call_type="generate",
+                              use_cache=True) -> ThreeActOutline:
+        """Async counterpart of LLMClient.request_outline."""
+        max_beats = prompt.beats_per_act
+        if structured:
+            try:
+                text = await self.complete(
+                    prompt.messages(structured=True),
+                    timeout=timeout,
+                    response_format=outline_response_format(max_beats, acts),
+                    call_type=call_type,
+                    use_cache=use_cache
+                )
+                return parse_outline_json(text, acts).truncated(max_beats)
+            except (_bad_request_error(), ValueError):
+                pass
+        text = await self.complete(prompt.messages(), timeout=timeout, call_type=call_type, use_cache=use_cache)
+        return outline_from_text(text, max_beats, acts)
+
+    async def complete_n(self, messages, n, timeout=None, response_format=None, call_type="other") -> list[str]:
+        """Async counterpart of LLMClient.complete_n."""
+        estimated = await asyncio.to_thread(self._estimate, messages)
+        start = time.perf_counter()
+        request_client = self.client.with_options(timeout=timeout) if timeout else self.client
+        request = dict(self._request(messages, response_format), n=n)
+        with span("llm.complete_n"):
+            completion, hedged = await call_hedged_async(
+                lambda: call_with_retries_async(lambda: request_client.chat.completions.create(**request), self.retry_policy),
+                self.hedge_policy
+            )
+        await asyncio.to_thread(
+            self._record, call_type, estimated, completion.usage, start, hedged=hedged, candidates=n
+        )
+        return _choice_texts(completion)
+
+    async def request_outline_candidates(self, prompt, n, acts=(1, 2, 3), structured=False, timeout=None,
+                                         call_type="generate") -> list[ThreeActOutline]:
+        """Async counterpart of LLMClient.request_outline_candidates."""
+        max_beats = prompt.beats_per_act
+        if structured:
+            try:
+                texts = await self.complete_n(
+                    prompt.messages(structured=True), n,
+                    timeout=timeout,
+                    response_format=outline_response_format(max_beats, acts),
+                    call_type=call_type
+                )
+                return [parse_outline_json(text, acts).truncated(max_beats) for text in texts]
+            except (_bad_request_error(), ValueError):
+                pass
+        try:
+            texts = await self.complete_n(prompt.messages(), n, timeout=timeout, call_type=call_type)
+        except _bad_request_error():
+            results = await asyncio.gather(
+                *(self.complete(prompt.messages(), timeout=timeout, call_type=call_type, use_cache=False) for _ in range(n)),
+                return_exceptions=True
+            )
+            texts = [result for result in results if not isinstance(result, BaseException)]
+            if not texts:
+                raise results[0]
+        return [outline_from_text(text, max_beats, acts) for text in texts]
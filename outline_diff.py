@@ -0,0 +1,132 @@
+import html
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Beats whose text is at least this similar count as one edited beat rather
+# than a removal plus an addition
+MATCH_THRESHOLD = 0.5
+
+EQUAL = "equal"
+INSERT = "insert"
+DELETE = "delete"
+CHANGE = "change"
+
+TOKEN_RE = re.compile(r"\s+|\w+|[^\w\s]")
+
+
+@dataclass(frozen=True)
+class BeatDiff:
+    """One aligned beat: `old` and/or `new` text and what happened to it."""
+    op: str
+    old: str = None
+    new: str = None
+
+
+def _pair_block(old, new):
+    """Diff a block of beats that differ, pairing similar beats in order.
+
+    Similarity is compared on words rather than characters, which is much
+    cheaper and close enough for deciding whether a beat was edited.
+    """
+    new_matchers = []
+    for beat in new:
+        matcher = SequenceMatcher(None, autojunk=False)
+        # SequenceMatcher indexes seq2, so each new beat is indexed once
+        matcher.set_seq2(beat.split())
+        new_matchers.append(matcher)
+
+    result = []
+    j = 0
+    for old_beat in old:
+        old_words = old_beat.split()
+        best, best_score = None, MATCH_THRESHOLD
+        for k in range(j, len(new)):
+            matcher = new_matchers[k]
+            matcher.set_seq1(old_words)
+            # The quick upper bounds rule out most non-matches without the full comparison
+            if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+                continue
+            score = matcher.ratio()
+            if score >= best_score:
+                best, best_score = k, score
+        if best is None:
+            result.append(BeatDiff(DELETE, old=old_beat))
+            continue
+        result.extend(BeatDiff(INSERT, new=beat) for beat in new[j:best])
+        result.append(BeatDiff(CHANGE, old=old_beat, new=new[best]))
+        j = best + 1
+    result.extend(BeatDiff(INSERT, new=beat) for beat in new[j:])
+    return result
+
+
+def diff_act(old, new):
+    """Beat-aligned diff of two beat lists: unchanged beats, edits, insertions and deletions."""
+    result = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if op == "equal":
+            result.extend(BeatDiff(EQUAL, old=beat, new=beat) for beat in old[i1:i2])
+        else:
+            result.extend(_pair_block(old[i1:i2], new[j1:j2]))
+    return tuple(result)
+
+
+@lru_cache(maxsize=256)
+def diff_outlines(old_acts, new_acts):
+    """(act1, act2, act3) diffs between two outlines given as tuples of beat tuples.
+
+    Results are cached per pair of outlines, so switching back and forth
+    between versions only diffs each pair once.
+    """
+    return tuple(diff_act(old, new) for old, new in zip(old_acts, new_acts))
+
+
+def diff_counts(act_diffs):
+    """{'insert', 'delete', 'change'} totals over the acts of a diff."""
+    counts = {INSERT: 0, DELETE: 0, CHANGE: 0}
+    for act in act_diffs:
+        for beat in act:
+            if beat.op != EQUAL:
+                counts[beat.op] += 1
+    return counts
+
+
+def inline_diff(old, new):
+    """Word-level (op, text) segments turning `old` into `new`; op is EQUAL, INSERT or DELETE."""
+    old_tokens = TOKEN_RE.findall(old)
+    new_tokens = TOKEN_RE.findall(new)
+    segments = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes():
+        if op == "equal":
+            segments.append((EQUAL, "".join(old_tokens[i1:i2])))
+            continue
+        if i2 > i1:
+            segments.append((DELETE, "".join(old_tokens[i1:i2])))
+        if j2 > j1:
+            segments.append((INSERT, "".join(new_tokens[j1:j2])))
+    return segments
+
+
+_INS = '<span style="background-color: rgba(33, 195, 84, 0.25)">{}</span>'
+_DEL = '<span style="background-color: rgba(255, 75, 75, 0.25); text-decoration: line-through">{}</span>'
+
+
+def act_diff_html(act_diff):
+    """Numbered HTML list of an act's diff with additions, removals and edits highlighted."""
+    items = []
+    for beat in act_diff:
+        if beat.op == EQUAL:
+            body = html.escape(beat.new)
+        elif beat.op == INSERT:
+            body = _INS.format(html.escape(beat.new))
+        elif beat.op == DELETE:
+            body = _DEL.format(html.escape(beat.old))
+        else:
+            body = "".join(
+                _INS.format(html.escape(text)) if op == INSERT else
+                _DEL.format(html.escape(text)) if op == DELETE else html.escape(text)
+                for op, text in inline_diff(beat.old, beat.new)
+            )
+        items.append(f"<li>{body}</li>")
+    return f"<ol>{''.join(items)}</ol>" if items else "<p><em>No beats</em></p>"
@@ -0,0 +1,55 @@
+from outline_parser import format_outline
+
+
+class OutlineModel:
+    """The beats of the three acts, with the outline text rebuilt only after a change.
+
+    Every mutation bumps `revision`. text() serializes the beats once per
+    revision, and callers that persist or render the outline can compare
+    revisions to skip work when nothing changed. The lists returned by
+    beats() must not be modified directly.
+    """
+
+    def __init__(self, act1=(), act2=(), act3=()):
+        self._acts = (list(act1), list(act2), list(act3))
+        self.revision = 0
+        self._text = None
+        self._text_revision = None
+
+    def beats(self, act: int) -> list[str]:
+        return self._acts[act - 1]
+
+    def acts(self):
+        """(act1, act2, act3) beat lists."""
+        return self._acts
+
+    def text(self) -> str:
+        if self._text_revision != self.revision:
+            self._text = format_outline(*self._acts)
+            self._text_revision = self.revision
+        return self._text
+
+    def set_beat(self, act: int, index: int, beat: str) -> bool:
+        """Replace one beat; returns False (and stays clean) if it is unchanged."""
+        beats = self._acts[act - 1]
+        if beats[index] == beat:
+            return False
+        beats[index] = beat
+        self.revision += 1
+        return True
+
+    def append_beat(self, act: int, beat: str):
+        self._acts[act - 1].append(beat)
+        self.revision += 1
+
+    def set_act(self, act: int, beats):
+        self._acts[act - 1][:] = beats
+        self.revision += 1
+
+    def set_acts(self, act1, act2, act3):
+        for act, beats in enumerate((act1, act2, act3), start=1):
+            self._acts[act - 1][:] = beats
+        self.revision += 1
+
+    def clear(self):
+        self.set_acts([], [], [])
@@ -0,0 +1,178 @@
+import json
+import re
+from dataclasses import dataclass, field
+
+from instrumentation import span
+
+# Classifies one outline line in a single match. Either
+#   - an act header: "Act I", "- Act II: Rising Action", "**Act III**", "### Act 2",
+#     "1. Act I - Setup". After the act number only separators, markdown
+#     decoration and a section name may follow, so beats that start with or
+#     mention an act ("Act 2 ends with a betrayal", "react in") are not headers, or
+#   - a beat: leading bullets / list numbers and a "Key beat N:" prefix are
+#     consumed, and the rest of the line is captured as `beat`.
+LINE_RE = re.compile(r"""
+    ^[ \t]*
+    (?:
+        [-*#>•\d.) \t]*act[ \t]+(?P<act>iii|ii|i|[123])\b
+        [-–—*#_:.() \t]*
+        (?:(?:setup|rising[ \t]+action|climax(?:[ \t]*(?:&|and)[ \t]*resolution)?|resolution)[*#_:.() \t]*)?
+        \r?$
+      |
+        (?:(?:[-*•+]|\d+[.)])[ \t]+)*
+        (?:key[ \t]+beat\b[^:\n]*(?::[ \t]*|$))?
+        (?P<beat>[^\n]*)
+    )
+""", re.IGNORECASE | re.MULTILINE | re.VERBOSE)
+
+# A line that is nothing but bold text, e.g. "**Setup**" or "**Inciting Incident:**"
+BOLD_HEADER_RE = re.compile(r"^\*\*[^*]*\*\*:?$")
+
+STRUCTURAL_KEYWORDS = frozenset({
+    'setup', 'rising action', 'climax', 'resolution', 'climax & resolution', 'climax and resolution',
+})
+# Anything longer than this can't be a (possibly bold, colon-terminated) structural keyword
+MAX_STRUCTURAL_LEN = max(map(len, STRUCTURAL_KEYWORDS)) + 5
+
+ACT_NUMBERS = {'i': 1, 'ii': 2, 'iii': 3, '1': 1, '2': 2, '3': 3}
+
+
+@dataclass
+class ThreeActOutline:
+    """Beats of a parsed outline, one list per act."""
+
+    act1: list[str] = field(default_factory=list)
+    act2: list[str] = field(default_factory=list)
+    act3: list[str] = field(default_factory=list)
+
+    def beats(self, act: int) -> list[str]:
+        return (self.act1, self.act2, self.act3)[act - 1]
+
+    def truncated(self, max_beats: int) -> "ThreeActOutline":
+        """Copy keeping at most `max_beats` beats per act."""
+        return ThreeActOutline(self.act1[:max_beats], self.act2[:max_beats], self.act3[:max_beats])
+
+
+def format_outline(act1, act2, act3) -> str:
+    """Serialize beat lists back into the app's outline text format."""
+    act1_text = "\n".join([f"- {b}" for b in act1])
+    act2_text = "\n".join([f"- {b}" for b in act2])
+    act3_text = "\n".join([f"- {b}" for b in act3])
+    return f"Act I - Setup\n{act1_text}\n\nAct II - Rising Action\n{act2_text}\n\nAct III - Climax & Resolution\n{act3_text}"
+
+
+def _beat_text(match):
+    """Beat text captured by LINE_RE, or None for blank and structural lines."""
+    beat = match.group('beat')
+    if not beat:
+        return None
+    beat = beat.strip()
+    if not beat:
+        return None
+    if beat[0] == '*' and BOLD_HEADER_RE.match(beat):
+        return None
+    if len(beat) <= MAX_STRUCTURAL_LEN and beat.strip('*:').strip().lower() in STRUCTURAL_KEYWORDS:
+        return None
+    return beat
+
+
+class OutlineStreamParser:
+    """Act/beat parser that can be fed text incrementally.
+
+    Act headers switch the current act; lines before the first header are
+    ignored. With `target_act` set (per-act regeneration), every beat goes to
+    that act and act headers are skipped.
+    """
+
+    def __init__(self, target_act=None):
+        self.target_act = target_act
+        self.current_act = target_act or 0
+        self._buffer = ""
+
+    def feed(self, text):
+        """Add streamed text; return (act, beat) pairs for every line completed by it."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        return [item for item in map(self.parse_line, lines) if item]
+
+    def close(self):
+        """Flush the final, unterminated line."""
+        line, self._buffer = self._buffer, ""
+        item = self.parse_line(line)
+        return [item] if item else []
+
+    def partial_beat(self):
+        """The beat currently being written, for live display."""
+        match = LINE_RE.match(self._buffer)
+        if not self.current_act or match.group('act'):
+            return None
+        return _beat_text(match)
+
+    def parse_line(self, line):
+        return self._apply(LINE_RE.match(line))
+
+    def _apply(self, match):
+        act = match.group('act')
+        if act:
+            if self.target_act is None:
+                self.current_act = ACT_NUMBERS[act.lower()]
+            return None
+        if not self.current_act:
+            return None
+        beat = _beat_text(match)
+        return (self.current_act, beat) if beat else None
+
+
+@span("parse.outline")
+def parse_outline(text: str) -> ThreeActOutline:
+    """Parse a full three-act outline into its beats in one regex pass."""
+    outline = ThreeActOutline()
+    parser = OutlineStreamParser()
+    apply = parser._apply
+    for match in LINE_RE.finditer(text):
+        item = apply(match)
+        if item:
+            outline.beats(item[0]).append(item[1])
+    return outline
+
+
+@span("parse.act")
+def parse_act(text: str, act: int) -> list[str]:
+    """Parse a single-act response; every beat is assigned to `act`."""
+    apply = OutlineStreamParser(target_act=act)._apply
+    return [item[1] for item in map(apply, LINE_RE.finditer(text)) if item]
+
+
+def outline_json_schema(beats_per_act: int, acts=(1, 2, 3)) -> dict:
+    """JSON schema (OpenAI `json_schema` response format) for exactly N beats per act."""
+    beat_list = {
+        "type": "array",
+        "items": {"type": "string"},
+        "minItems": beats_per_act,
+        "maxItems": beats_per_act,
+    }
+    return {
+        "name": "story_outline",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {f"act{act}": beat_list for act in acts},
+            "required": [f"act{act}" for act in acts],
+            "additionalProperties": False,
+        },
+    }
+
+
+@span("parse.outline_json")
+def parse_outline_json(text: str, acts=(1, 2, 3)) -> ThreeActOutline:
+    """Read a structured-output response; raises ValueError if it doesn't match the schema."""
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("structured outline is not a JSON object")
+    outline = ThreeActOutline()
+    for act in acts:
+        beats = data.get(f"act{act}")
+        if not isinstance(beats, list) or not all(isinstance(b, str) for b in beats):
+            raise ValueError(f"structured outline has no beat list for act{act}")
+        outline.beats(act).extend(b.strip() for b in beats if b.strip())
+    return outline
@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+
+# CSS injected by streamlit_app.py. Streamlit needs it re-sent on every
+# rerun, but each combination is minified and wrapped only once per process.
+
+DARK_MODE_CSS = """
+/* Dark mode styles */
+.stApp {
+    background-color: #0e1117;
+    color: #fafafa;
+}
+
+/* Sidebar styling */
+[data-testid="stSidebar"] {
+    background-color: #262730;
+}
+[data-testid="stSidebar"] * {
+    color: #fafafa !important;
+}
+
+/* Headers */
+h1, h2, h3, h4, h5, h6 {
+    color: #fafafa !important;
+}
+
+/* Text inputs and areas */
+.stTextInput > div > div > input,
+.stTextArea > div > div > textarea,
+.stNumberInput > div > div > input {
+    background-color: #262730;
+    color: #fafafa;
+    border-color: #4a4a4a;
+}
+
+/* Buttons */
+.stButton > button {
+    background-color: #262730;
+    color: #fafafa;
+    border-color: #4a4a4a;
+}
+.stButton > button:hover {
+    background-color: #3a3a4a;
+}
+
+/* Expanders */
+.streamlit-expanderHeader {
+    background-color: #262730;
+    color: #fafafa;
+}
+
+/* Selectbox */
+.stSelectbox > div > div {
+    background-color: #262730;
+    color: #fafafa;
+}
+
+/* Labels */
+label {
+    color: #fafafa !important;
+}
+
+/* Captions */
+.stCaptionContainer {
+    color: #b0b0b0 !important;
+}
+
+/* All markdown text */
+div[data-testid="stMarkdownContainer"] p {
+    color: #fafafa !important;
+}
+"""
+
+# Generate button - cerulean color
+PRIMARY_BUTTON_CSS = """
+/* Generate button customization */
+button[kind="primary"] {
+    background-color: #2596be !important;
+    border-color: #2596be !important;
+}
+button[kind="primary"]:hover {
+    background-color: #1e7a9a !important;
+    border-color: #1e7a9a !important;
+}
+"""
+
+# Larger text in the beat editors
+TEXT_AREA_CSS = """
+.stTextArea textarea {
+    font-size: 16px !important;
+    line-height: 1.6 !important;
+}
+"""
+
+
+@lru_cache(maxsize=8)
+def style_tag(*blocks):
+    """One minified <style> element holding the given CSS blocks."""
+    css = re.sub(r"/\*.*?\*/", "", "".join(blocks), flags=re.S)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    css = re.sub(r"\s+", " ", css).strip()
+    return f"<style>{css}</style>"
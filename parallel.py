@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def run_parallel(tasks, timeout=None, max_workers=None):
+    """Run zero-argument callables concurrently and collect their outcomes.
+
+    `tasks` maps a key (e.g. an act number) to a callable. Returns a dict
+    mapping each key to a `(result, error)` pair, exactly one of which is
+    None. A task that raises only fails its own key, and any task still
+    running after `timeout` seconds is reported as a TimeoutError without
+    holding up the others.
+    """
+    if not tasks:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(tasks))
+    futures = {key: executor.submit(task) for key, task in tasks.items()}
+    try:
+        wait(futures.values(), timeout=timeout)
+    finally:
+        # Don't block on stragglers; their results are simply discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    outcomes = {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            outcomes[key] = (None, TimeoutError(f"timed out after {timeout}s"))
+        elif future.cancelled():
+            outcomes[key] = (None, TimeoutError("cancelled before it started"))
+        elif future.exception() is not None:
+            outcomes[key] = (None, future.exception())
+        else:
+            outcomes[key] = (future.result(), None)
+    return outcomes
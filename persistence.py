@@ -0,0 +1,184 @@
+import abc
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from instrumentation import span
+
+
+class OutlineStore(abc.ABC):
+    """Interface for persisting outlines and their version history per project.
+
+    `state` is a JSON-serializable dict (beats, settings, story text);
+    versions are appended as (timestamp, [act1, act2, act3], label).
+    """
+
+    @abc.abstractmethod
+    def load_outline(self, project_id):
+        ...
+
+    @abc.abstractmethod
+    def load_versions(self, project_id, limit=None):
+        """List of {'timestamp', 'acts': [act1, act2, act3], 'label'} in order; only the newest `limit` if given."""
+
+    @abc.abstractmethod
+    def save_outline(self, project_id, state):
+        ...
+
+    @abc.abstractmethod
+    def append_version(self, project_id, timestamp, acts, label=None):
+        ...
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class SQLiteOutlineStore(OutlineStore):
+    """SQLite-backed store with debounced, batched writes.
+
+    Writes are queued in memory and committed together, in one transaction,
+    by a background thread once no new write has arrived for `debounce`
+    seconds, but at the latest `flush_interval` seconds after the first
+    queued write (or as soon as `max_pending` writes are queued). Repeated
+    saves of the same project between flushes collapse into a single row
+    update, so a burst of edits costs one write. Reads see queued writes,
+    and everything is flushed at interpreter exit.
+    """
+
+    def __init__(self, path, flush_interval=2.0, max_pending=50, debounce=0.5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._pending_outlines = {}
+        self._pending_versions = []
+        self._first_pending_at = None
+        self._last_write_at = None
+        self._wake = threading.Event()
+        self._closed = False
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outlines ("
+                "project_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS versions ("
+                "project_id TEXT NOT NULL, seq INTEGER NOT NULL, timestamp TEXT NOT NULL, acts TEXT NOT NULL, "
+                "label TEXT, PRIMARY KEY (project_id, seq))"
+            )
+            # Stores created before versions had labels
+            if "label" not in [row[1] for row in self._conn.execute("PRAGMA table_info(versions)")]:
+                self._conn.execute("ALTER TABLE versions ADD COLUMN label TEXT")
+        self._flusher = threading.Thread(target=self._flush_loop, name="outline-store-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def load_outline(self, project_id):
+        with self._lock:
+            if project_id in self._pending_outlines:
+                return self._pending_outlines[project_id]
+            row = self._conn.execute(
+                "SELECT state FROM outlines WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_versions(self, project_id, limit=None):
+        with self._lock:
+            pending = [v for v in self._pending_versions if v[0] == project_id]
+            # LIMIT -1 is no limit
+            rows = self._conn.execute(
+                "SELECT timestamp, acts, label FROM ("
+                "SELECT seq, timestamp, acts, label FROM versions WHERE project_id = ? ORDER BY seq DESC LIMIT ?"
+                ") ORDER BY seq",
+                (project_id, -1 if limit is None else max(limit - len(pending), 0))
+            ).fetchall()
+        versions = [{'timestamp': ts, 'acts': json.loads(acts), 'label': label} for ts, acts, label in rows]
+        versions += [{'timestamp': ts, 'acts': acts, 'label': label} for _, ts, acts, label in pending]
+        return versions if limit is None else versions[max(len(versions) - limit, 0):]
+
+    def save_outline(self, project_id, state):
+        with self._lock:
+            self._pending_outlines[project_id] = state
+            self._queued()
+
+    @span("store.append_version")
+    def append_version(self, project_id, timestamp, acts, label=None):
+        with self._lock:
+            self._pending_versions.append((project_id, timestamp, [list(a) for a in acts], label))
+            self._queued()
+
+    @span("store.flush")
+    def flush(self):
+        with self._lock:
+            outlines, self._pending_outlines = self._pending_outlines, {}
+            versions, self._pending_versions = self._pending_versions, []
+            self._first_pending_at = None
+            if not outlines and not versions:
+                return
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO outlines (project_id, state, updated_at) VALUES (?, ?, ?)",
+                    [(pid, json.dumps(state), now) for pid, state in outlines.items()],
+                )
+                for pid, ts, acts, label in versions:
+                    self._conn.execute(
+                        "INSERT INTO versions (project_id, seq, timestamp, acts, label) VALUES "
+                        "(?, (SELECT COALESCE(MAX(seq), -1) + 1 FROM versions WHERE project_id = ?), ?, ?, ?)",
+                        (pid, pid, ts, json.dumps(acts), label),
+                    )
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def _queued(self):
+        # Called with the lock held
+        now = time.monotonic()
+        self._last_write_at = now
+        if self._first_pending_at is None:
+            self._first_pending_at = now
+        if len(self._pending_outlines) + len(self._pending_versions) >= self.max_pending:
+            self._wake.set()
+
+    def _flush_due(self):
+        with self._lock:
+            if self._first_pending_at is None:
+                return False
+            now = time.monotonic()
+            return (
+                now - self._last_write_at >= self.debounce
+                or now - self._first_pending_at >= self.flush_interval
+                or len(self._pending_outlines) + len(self._pending_versions) >= self.max_pending
+            )
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(min(self.debounce, self.flush_interval))
+            self._wake.clear()
+            if not self._closed and self._flush_due():
+                self.flush()
+
+
+def open_store(url: str) -> OutlineStore:
+    """Open the outline store for a URL such as 'sqlite:///.outline_cache/outlines.sqlite3'.
+
+    As with SQLAlchemy URLs, three slashes give a relative path and four an absolute one.
+    """
+    scheme, _, location = url.partition("://")
+    if scheme == "sqlite":
+        return SQLiteOutlineStore(location[1:] if location.startswith("/") else location)
+    raise ValueError(f"Unsupported outline store URL: {url}")
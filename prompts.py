@@ -0,0 +1,140 @@
+from dataclasses import dataclass, field
+
+# Providers cache the longest previously seen prompt prefix (OpenAI from
+# 1024 tokens on), so every prompt is laid out from most to least stable:
+# the fixed system/instruction text, then the story material (the same for
+# every call on a story), then the current outline, and the per-call task
+# last. Keep anything that changes between calls out of the constants below.
+
+SYSTEM_PROMPT = "You are a helpful story outline assistant. When creating stories, promote diversity and inclusive representation of characters across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."
+
+OUTLINE_INSTRUCTIONS = """You write three-act story outlines from the story material you are given.
+
+Unless the task asks for a single act, an outline follows this format:
+
+- Act I
+- Setup
+    - Key beat 1
+    - Key beat 2
+- Act II
+- Rising Action
+    - Key beat 1
+    - Key beat 2
+- Act III
+- Climax & Resolution
+    - Key beat 1
+    - Key beat 2
+
+Guidelines:
+- Use hierarchical bullet formatting.
+- Provide exactly the number of key beats per act that the task asks for.
+- Do NOT include a summary or explanations.
+- Keep the outline tight and structured like a screenplay or novel planner.
+- Focus purely on plot beats and story flow.
+- Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."""
+
+SUMMARY_INSTRUCTIONS = """You summarize parts of a story manuscript so they can be used to plan a story outline.
+Keep every named character, the setting, the key events in the order they happen, the central conflicts and the tone.
+Be concise and do not add anything that is not in the text."""
+
+STRUCTURED_OUTPUT_TASK = """
+Ignore the bullet formatting above and respond ONLY with a JSON object that has one list of beats per requested act
+(keys "act1" = Setup, "act2" = Rising Action, "act3" = Climax & Resolution), {beats_per_act} beats each.
+Each list item is the text of a single beat with no numbering, bullets or "Key beat" labels."""
+
+ACT_SECTION_NAMES = {1: "Act I - Setup", 2: "Act II - Rising Action", 3: "Act III - Climax & Resolution"}
+
+
+@dataclass
+class OutlinePrompt:
+    """An outline request split into its stable and volatile parts.
+
+    `kind` and `params` name the builder below that made it and its
+    arguments, so the request can be sent to the outline service and
+    rebuilt there with build_prompt().
+    """
+    material: str
+    task: str
+    beats_per_act: int
+    current_outline: str = None
+    kind: str = "generate"
+    params: dict = field(default_factory=dict)
+
+    @property
+    def acts(self):
+        return (self.params["act"],) if self.kind == "regenerate-act" else (1, 2, 3)
+
+    @property
+    def call_type(self):
+        if self.kind == "regenerate-act":
+            return f"regenerate-act-{self.params['act']}"
+        return "regenerate-all" if self.kind == "regenerate" else "generate"
+
+    def messages(self, structured=False):
+        sections = [f"Story material:\n{self.material}"]
+        if self.current_outline:
+            sections.append(f"Current outline:\n{self.current_outline}")
+        task = self.task
+        if structured:
+            task += STRUCTURED_OUTPUT_TASK.format(beats_per_act=self.beats_per_act)
+        sections.append(f"Task:\n{task}")
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT + "\n\n" + OUTLINE_INSTRUCTIONS},
+            {"role": "user", "content": "\n\n".join(sections)},
+        ]
+
+
+def generate_outline_prompt(material, beats_per_act):
+    return OutlinePrompt(
+        material,
+        f"Create a clear, detailed, visual story outline based on the story material, "
+        f"with EXACTLY {beats_per_act} key beats for each act.",
+        beats_per_act,
+        kind="generate",
+        params={"material": material, "beats_per_act": beats_per_act},
+    )
+
+
+def regenerate_outline_prompt(material, current_outline, instructions, beats_per_act):
+    return OutlinePrompt(
+        material,
+        f"Create a clear, detailed, visual story outline based on the story material and the current outline, "
+        f"with EXACTLY {beats_per_act} key beats for each act.\n"
+        f"Additional instructions for this regeneration:\n{instructions}",
+        beats_per_act,
+        current_outline,
+        kind="regenerate",
+        params={"material": material, "current_outline": current_outline, "instructions": instructions,
+                "beats_per_act": beats_per_act},
+    )
+
+
+def regenerate_act_prompt(material, current_outline, act, beats_per_act):
+    return OutlinePrompt(
+        material,
+        f"Generate ONLY the {ACT_SECTION_NAMES[act]} section with {beats_per_act} key beats "
+        f"in hierarchical bullet format, based on the story material and the current outline.",
+        beats_per_act,
+        current_outline,
+        kind="regenerate-act",
+        params={"material": material, "current_outline": current_outline, "act": act, "beats_per_act": beats_per_act},
+    )
+
+
+PROMPT_BUILDERS = {
+    "generate": generate_outline_prompt,
+    "regenerate": regenerate_outline_prompt,
+    "regenerate-act": regenerate_act_prompt,
+}
+
+
+def build_prompt(kind, params) -> OutlinePrompt:
+    """Rebuild an OutlinePrompt from its `kind` and `params`."""
+    return PROMPT_BUILDERS[kind](**params)
+
+
+def summary_messages(chunk):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + "\n\n" + SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": chunk},
+    ]
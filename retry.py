@@ -0,0 +1,156 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import lru_cache
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+@lru_cache(maxsize=1)
+def retryable_errors():
+    """Rate limits, 5xx responses, timeouts and dropped connections.
+
+    Looked up only once a request has failed, so importing this module
+    doesn't import the OpenAI SDK.
+    """
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    return (RateLimitError, InternalServerError, APIConnectionError)
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After when the provider sends it."""
+    max_retries: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def delay(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self.max_delay)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class HedgePolicy:
+    """When to send a duplicate of a slow request.
+
+    Tracks the latency of recent successful requests; once `min_samples`
+    are known, a request still running after the `percentile` latency
+    (or after `after_s`, if given) gets a second copy, and whichever
+    answers first wins.
+    """
+
+    def __init__(self, percentile=0.95, after_s=None, min_samples=20, window=200):
+        self.percentile = percentile
+        self.after_s = after_s
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_s):
+        with self._lock:
+            self._latencies.append(latency_s)
+
+    def threshold(self):
+        """Seconds to wait before hedging, or None while there is too little data."""
+        if self.after_s is not None:
+            return self.after_s
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+
+
+def call_with_retries(fn, policy=None):
+    """fn() retried on retryable_errors() according to `policy` (no retries without one)."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except retryable_errors() as e:
+            if policy is None or attempt >= policy.max_retries:
+                raise
+            time.sleep(policy.delay(attempt, e))
+            attempt += 1
+
+
+async def call_with_retries_async(fn, policy=None):
+    """Async counterpart of call_with_retries; `fn` returns an awaitable."""
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except retryable_errors() as e:
+            if policy is None or attempt >= policy.max_retries:
+                raise
+            await asyncio.sleep(policy.delay(attempt, e))
+            attempt += 1
+
+
+def call_hedged(fn, hedge=None):
+    """fn(), plus a duplicate call if the first is slower than the hedge threshold.
+
+    Returns (result, hedged). A losing duplicate is left to finish in the
+    background (blocking HTTP calls cannot be interrupted).
+    """
+    threshold = hedge.threshold() if hedge is not None else None
+    start = time.perf_counter()
+    if threshold is None:
+        result = fn()
+        if hedge is not None:
+            hedge.record(time.perf_counter() - start)
+        return result, False
+
+    futures = [_hedge_executor.submit(fn)]
+    done, _ = wait(futures, timeout=threshold)
+    if not done:
+        futures.append(_hedge_executor.submit(fn))
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                hedge.record(time.perf_counter() - start)
+                return future.result(), len(futures) > 1
+            error = error or future.exception()
+    raise error
+
+
+async def call_hedged_async(fn, hedge=None):
+    """Async counterpart of call_hedged; the losing request is cancelled."""
+    threshold = hedge.threshold() if hedge is not None else None
+    start = time.perf_counter()
+    if threshold is None:
+        result = await fn()
+        if hedge is not None:
+            hedge.record(time.perf_counter() - start)
+        return result, False
+
+    tasks = [asyncio.ensure_future(fn())]
+    done, _ = await asyncio.wait(tasks, timeout=threshold)
+    if not done:
+        tasks.append(asyncio.ensure_future(fn()))
+    pending = set(tasks)
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    hedge.record(time.perf_counter() - start)
+                    return task.result(), len(tasks) > 1
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
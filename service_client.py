@@ -0,0 +1,44 @@
+import requests
+
+from outline_parser import ThreeActOutline
+
+
+class OutlineServiceClient:
+    """HTTP client for the outline service in api.py.
+
+    One `requests.Session` is kept so connections to the service are reused.
+    """
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _post(self, path, payload, timeout=None):
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout or self.timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(f"Outline service unreachable: {e}") from e
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            raise RuntimeError(f"Outline service error {response.status_code}: {detail}")
+        return response
+
+    def request_outline(self, prompt, model, temperature, structured=False, use_cache=True, timeout=None) -> ThreeActOutline:
+        """Send an OutlinePrompt to the endpoint for its kind and return the beats."""
+        payload = dict(prompt.params, model=model, temperature=temperature, structured=structured, use_cache=use_cache)
+        data = self._post(f"/api/v1/outlines/{prompt.kind}", payload, timeout).json()
+        return ThreeActOutline(data["act1"], data["act2"], data["act3"])
+
+    def request_outline_candidates(self, prompt, n, model, temperature, structured=False, timeout=None) -> list[ThreeActOutline]:
+        """`n` alternative outlines for an OutlinePrompt."""
+        payload = dict(prompt.params, model=model, temperature=temperature, structured=structured, candidates=n)
+        data = self._post(f"/api/v1/outlines/{prompt.kind}", payload, timeout).json()
+        return [ThreeActOutline(c["act1"], c["act2"], c["act3"]) for c in data["candidates"]]
+
+    def export(self, export_format, title, story_summary, outline_text) -> bytes:
+        payload = {"format": export_format, "title": title, "story_summary": story_summary, "outline_text": outline_text}
+        return self._post("/api/v1/outlines/export", payload).content
@@ -1,17 +1,46 @@
 import streamlit as st
+import hashlib
 import json
 import os
-import requests
-from openai import OpenAI
 from datetime import datetime
-from io import BytesIO
 import re
+import time
+import uuid
+from extraction import ExtractionCache, file_digest, iter_extracted_text
+from exports import EXPORT_MIME_TYPES, export_document
+from instrumentation import enable_opentelemetry, metrics, span
+from jobs import DONE, FAILED, JobQueue
+from llm import LLMClient
+from llm_cache import ResponseCache
+from outline_diff import act_diff_html, diff_counts, diff_outlines
+from outline_model import OutlineModel
+from outline_parser import OutlineStreamParser
+from parallel import run_parallel
+from page_styles import DARK_MODE_CSS, PRIMARY_BUTTON_CSS, TEXT_AREA_CSS, style_tag
+from version_store import VersionStore
+from persistence import open_store
+from retry import HedgePolicy, RetryPolicy
+from prompts import ACT_SECTION_NAMES, generate_outline_prompt, regenerate_act_prompt, regenerate_outline_prompt, summary_messages
+from summarize import condense_document
+from token_accounting import UsageLedger, trim_to_token_budget
 
 # -------------------------
 # 1. User uploads/inputs story idea
 # -------------------------
 
 st.set_page_config(page_title="Dynamic Outline", page_icon="📝", layout="wide")
+_rerun_started = time.perf_counter()
+
+# Timings of the hot paths are always collected (see instrumentation.py);
+# OUTLINE_DEBUG=1 or ?debug=1 shows them in the sidebar, and OUTLINE_OTEL=1
+# also sends them to an OpenTelemetry collector.
+show_timings = os.environ.get("OUTLINE_DEBUG") == "1" or st.query_params.get("debug") == "1"
+
+@st.cache_resource
+def _enable_tracing():
+    return os.environ.get("OUTLINE_OTEL") == "1" and enable_opentelemetry()
+
+_enable_tracing()
 
 # Helper functions for document generation
 def generate_filename_from_story(story_text):
@@ -32,118 +61,120 @@ def generate_story_title(story_text):
     first_sentence = story_text.split('.')[0] if '.' in story_text else story_text[:60]
     return first_sentence.strip()
 
-def create_pdf_document(title, story_summary, outline_text):
-    """Create a PDF document with proper formatting."""
-    try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter,
-                                rightMargin=inch, leftMargin=inch,
-                                topMargin=inch, bottomMargin=inch)
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Title style
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=14,
-            fontName='Times-Roman',
-            alignment=TA_CENTER,
-            spaceAfter=12
-        )
-        
-        # Body style - double spaced
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['BodyText'],
-            fontSize=12,
-            fontName='Times-Roman',
-            leading=24,  # Double spacing (2 * 12pt)
-            alignment=TA_LEFT
-        )
-        
-        # Add title
-        story.append(Paragraph(title, title_style))
-        story.append(Spacer(1, 0.2*inch))
-        
-        # Add story summary
-        story.append(Paragraph(f"<b>Story Summary:</b> {story_summary}", body_style))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Add outline
-        for line in outline_text.split('\n'):
-            if line.strip():
-                story.append(Paragraph(line, body_style))
-                story.append(Spacer(1, 0.1*inch))
-        
-        doc.build(story)
-        buffer.seek(0)
-        return buffer
-    except ImportError:
-        st.error("PDF generation requires reportlab. Install with: pip install reportlab")
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_export(export_format, title, story_summary, outline_text):
+    """Build export file bytes, memoized on (format, title, summary, outline text).
+
+    Errors are raised, not cached, so a failed export is retried on the next click."""
+    if outline_service is not None:
+        return outline_service.export(export_format, title, story_summary, outline_text)
+    return export_document(export_format, title, story_summary, outline_text)
+
+# With OUTLINE_SERVICE_URL set (e.g. http://127.0.0.1:8000, see api.py),
+# outlines are generated and exported by the outline service instead of
+# in this script.
+@st.cache_resource
+def get_outline_service():
+    url = os.environ.get("OUTLINE_SERVICE_URL")
+    if not url:
         return None
+    from service_client import OutlineServiceClient
+    return OutlineServiceClient(url)
+
+outline_service = get_outline_service()
+
+# The page is split into fragments (this export panel, the act editors and
+# the version history panel) that rerun on their own when their widgets
+# change. They share state only through st.session_state: the OutlineModel
+# in `outline` (beats and their serialized text) and outline_versions.
+# Anything that changes the page layout (generation, restore) does a full
+# st.rerun().
+
+@st.fragment
+def _export_panel():
+    """Sidebar export. The file is built from the beats as they are when
+    "Prepare download" is clicked, since beat edits don't rerun this panel."""
+    st.divider()
+    st.subheader("📥 Download Outline")
 
-def create_docx_document(title, story_summary, outline_text):
-    """Create a DOCX document with proper formatting."""
-    try:
-        from docx import Document
-        from docx.shared import Pt, Inches
-        from docx.enum.text import WD_ALIGN_PARAGRAPH
-        
-        doc = Document()
-        
-        # Set default font
-        style = doc.styles['Normal']
-        font = style.font
-        font.name = 'Times New Roman'
-        font.size = Pt(12)
-        
-        # Set paragraph spacing for double-spacing
-        paragraph_format = style.paragraph_format
-        paragraph_format.line_spacing = 2.0
-        
-        # Add title
-        title_para = doc.add_paragraph(title)
-        title_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        title_run = title_para.runs[0]
-        title_run.font.size = Pt(14)
-        title_run.font.bold = True
-        
-        doc.add_paragraph()  # Blank line
-        
-        # Add story summary
-        summary_para = doc.add_paragraph()
-        summary_para.add_run('Story Summary: ').bold = True
-        summary_para.add_run(story_summary)
-        
-        doc.add_paragraph()  # Blank line
-        
-        # Add outline
-        for line in outline_text.split('\n'):
-            if line.strip():
-                doc.add_paragraph(line)
-        
-        buffer = BytesIO()
-        doc.save(buffer)
-        buffer.seek(0)
-        return buffer
-    except ImportError:
-        st.error("DOCX generation requires python-docx. Install with: pip install python-docx")
-        return None
+    download_format = st.selectbox(
+        "Select format:",
+        ["PDF", "DOCX", "TXT"],
+        key="download_format_select"
+    )
 
-def create_txt_document(title, story_summary, outline_text):
-    """Create a plain text document."""
-    content = f"{title}\n{'='*len(title)}\n\n"
-    content += f"Story Summary: {story_summary}\n\n"
-    content += outline_text
-    return content
+    # Get story idea for title and filename
+    story_text = st.session_state.get('story_idea_text', 'Story Outline')
+    title = generate_story_title(story_text)
+    filename_base = generate_filename_from_story(story_text)
+    story_summary = story_text[:200] + "..." if len(story_text) > 200 else story_text
+
+    if st.button("📦 Prepare download", key="prepare_download", use_container_width=True):
+        outline_text = st.session_state.outline.text()
+        try:
+            # Only rebuilt when the outline (or title/summary) actually changed
+            st.session_state.prepared_export = {
+                'format': download_format,
+                'data': render_export(download_format, title, story_summary, outline_text),
+                'time': datetime.now().strftime('%H:%M:%S'),
+            }
+        except (ImportError, RuntimeError) as e:
+            st.session_state.prepared_export = None
+            st.error(str(e))
+
+    prepared = st.session_state.get('prepared_export')
+    if prepared and prepared['format'] == download_format and prepared['data']:
+        st.download_button(
+            label=f"📄 Download {download_format}",
+            data=prepared['data'],
+            file_name=f"{filename_base}.{download_format.lower()}",
+            mime=EXPORT_MIME_TYPES[download_format],
+            use_container_width=True
+        )
+        st.caption(f"Outline as of {prepared['time']}")
+
+# Outlines and their version history are persisted per project, so they
+# survive tab reloads and server restarts and idle sessions can be dropped
+# from memory. The project id is kept in the page URL (?project=...).
+# Set OUTLINE_STORE_URL to use a different database.
+@st.cache_resource
+def get_outline_store():
+    return open_store(os.environ.get("OUTLINE_STORE_URL", "sqlite:///.outline_cache/outlines.sqlite3"))
+
+outline_store = get_outline_store()
+
+# Versions kept per session; older ones are dropped (and not loaded from the
+# store) once a history grows past this
+MAX_VERSIONS = int(os.environ.get("OUTLINE_MAX_VERSIONS", "200"))
+
+# Prompt/completion tokens and latency per call type; totals are per session,
+# the JSONL log (OUTLINE_USAGE_LOG) collects every call in the process.
+if 'usage_ledger' not in st.session_state:
+    st.session_state.usage_ledger = UsageLedger(
+        log_path=os.environ.get("OUTLINE_USAGE_LOG", os.path.join(".outline_cache", "usage.jsonl"))
+    )
+usage_ledger = st.session_state.usage_ledger
+
+if 'project_id' not in st.session_state:
+    project_id = st.query_params.get("project") or uuid.uuid4().hex
+    st.query_params["project"] = project_id
+    st.session_state.project_id = project_id
+    saved = outline_store.load_outline(project_id)
+    if saved:
+        st.session_state.outline = OutlineModel(saved['act1_beats'], saved['act2_beats'], saved['act3_beats'])
+        st.session_state.outline_generated = saved['outline_generated']
+        st.session_state.plot_points_per_act = saved['plot_points_per_act']
+        if saved.get('story_idea'):
+            st.session_state.story_idea_input = saved['story_idea']
+            st.session_state.story_idea_text = saved['story_idea']
+    # History is only read from disk the first time it is needed
+    st.session_state.outline_versions = VersionStore(
+        loader=lambda: outline_store.load_versions(project_id, limit=MAX_VERSIONS), max_versions=MAX_VERSIONS
+    )
+
+# Beats of the current outline; its text is re-serialized only after an edit
+if 'outline' not in st.session_state:
+    st.session_state.outline = OutlineModel()
 
 # Dark mode toggle in sidebar
 if 'dark_mode' not in st.session_state:
@@ -160,146 +191,69 @@ with st.sidebar:
         st.session_state.dark_mode = dark_mode
         st.rerun()
     
+    # Generation section
+    st.subheader("🤖 Generation")
+    stream_responses = st.toggle(
+        "⚡ Stream responses",
+        value=True,
+        help="Show beats as the model writes them. Stopping keeps the beats generated so far."
+    )
+    bypass_cache = st.toggle(
+        "🎲 Bypass response cache",
+        value=False,
+        help="Always request a fresh sample instead of reusing a cached response for the same prompt"
+    )
+    structured_output = st.toggle(
+        "🧩 Structured output (JSON)",
+        value=False,
+        help="Ask the model for a JSON object with exactly the requested number of beats per act instead of a bulleted outline. Falls back to the bulleted outline if the model doesn't support it. Responses are not streamed in this mode."
+    )
+    candidate_count = st.number_input(
+        "🎲 Candidates per outline",
+        min_value=1,
+        max_value=5,
+        value=1,
+        help="Generate several alternative outlines in one request and pick one side by side. Every candidate is kept in the version history. Candidates are not streamed."
+    )
+    # The outline service returns whole outlines, so responses are only streamed inline
+    use_streaming = stream_responses and not structured_output and outline_service is None
+    
+    # Upload section
+    st.subheader("📄 Upload")
+    max_extract_chars = st.number_input(
+        "Max characters to extract:",
+        min_value=1000,
+        value=200000,
+        step=10000,
+        help="Extraction stops once this many characters have been read from an uploaded file"
+    )
+    
+    # Token usage section
+    with st.expander("📊 Token Usage"):
+        usage_totals = usage_ledger.totals()
+        if not usage_totals:
+            st.caption("No LLM calls yet in this session.")
+        else:
+            st.dataframe(
+                [{"call type": call_type, **totals} for call_type, totals in sorted(usage_totals.items())],
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption(
+                f"Session total: {sum(t['prompt_tokens'] for t in usage_totals.values()):,} prompt + "
+                f"{sum(t['completion_tokens'] for t in usage_totals.values()):,} completion tokens"
+            )
+            st.caption(f"Provider prompt-cache hit rate: {usage_ledger.prompt_cache_hit_rate():.0%} of prompt tokens")
+    
     # Download section
     if st.session_state.get('outline_generated', False):
-        st.divider()
-        st.subheader("📥 Download Outline")
-        
-        download_format = st.selectbox(
-            "Select format:",
-            ["PDF", "DOCX", "TXT"],
-            key="download_format_select"
-        )
-        
-        # Placeholder for story_idea_text and outline data
-        # In a real app, these would be populated from session_state after generation
-        # For now, we'll use dummy data or rely on actual session state if available
-        
-        # Get story idea for title and filename
-        story_text = st.session_state.get('story_idea_text', 'Story Outline')
-        title = generate_story_title(story_text)
-        filename_base = generate_filename_from_story(story_text)
-        
-        # Construct outline text
-        act1_text = "\n".join([f"- {beat}" for beat in st.session_state.get('act1_beats', [])])
-        act2_text = "\n".join([f"- {beat}" for beat in st.session_state.get('act2_beats', [])])
-        act3_text = "\n".join([f"- {beat}" for beat in st.session_state.get('act3_beats', [])])
-        outline_text = f"Act I - Setup\n{act1_text}\n\nAct II - Rising Action\n{act2_text}\n\nAct III - Climax & Resolution\n{act3_text}"
-        
-        story_summary = story_text[:200] + "..." if len(story_text) > 200 else story_text
-        
-        if download_format == "PDF":
-            pdf_buffer = create_pdf_document(title, story_summary, outline_text)
-            if pdf_buffer:
-                st.download_button(
-                    label="📄 Download PDF",
-                    data=pdf_buffer,
-                    file_name=f"{filename_base}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
-        elif download_format == "DOCX":
-            docx_buffer = create_docx_document(title, story_summary, outline_text)
-            if docx_buffer:
-                st.download_button(
-                    label="📄 Download DOCX",
-                    data=docx_buffer,
-                    file_name=f"{filename_base}.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True
-                )
-        else:  # TXT
-            txt_content = create_txt_document(title, story_summary, outline_text)
-            st.download_button(
-                label="📄 Download TXT",
-                data=txt_content,
-            )
+        _export_panel()
 
-# Apply dark mode CSS
-if st.session_state.dark_mode:
-    st.markdown("""
-        <style>
-        /* Dark mode styles */
-        .stApp {
-            background-color: #0e1117;
-            color: #fafafa;
-        }
-        
-        /* Sidebar styling */
-        [data-testid="stSidebar"] {
-            background-color: #262730;
-        }
-        [data-testid="stSidebar"] * {
-            color: #fafafa !important;
-        }
-        
-        /* Headers */
-        h1, h2, h3, h4, h5, h6 {
-            color: #fafafa !important;
-        }
-        
-        /* Text inputs and areas */
-        .stTextInput > div > div > input,
-        .stTextArea > div > div > textarea,
-        .stNumberInput > div > div > input {
-            background-color: #262730;
-            color: #fafafa;
-            border-color: #4a4a4a;
-        }
-        
-        /* Buttons */
-        .stButton > button {
-            background-color: #262730;
-            color: #fafafa;
-            border-color: #4a4a4a;
-        }
-        .stButton > button:hover {
-            background-color: #3a3a4a;
-        }
-        
-        /* Expanders */
-        .streamlit-expanderHeader {
-            background-color: #262730;
-            color: #fafafa;
-        }
-        
-        /* Selectbox */
-        .stSelectbox > div > div {
-            background-color: #262730;
-            color: #fafafa;
-        }
-        
-        /* Labels */
-        label {
-            color: #fafafa !important;
-        }
-        
-        /* Captions */
-        .stCaptionContainer {
-            color: #b0b0b0 !important;
-        }
-        
-        /* All markdown text */
-        div[data-testid="stMarkdownContainer"] p {
-            color: #fafafa !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-# Custom CSS for generate button - cerulean color
-st.markdown("""
-    <style>
-    /* Generate button customization */
-    button[kind="primary"] {
-        background-color: #2596be !important;
-        border-color: #2596be !important;
-    }
-    button[kind="primary"]:hover {
-        background-color: #1e7a9a !important;
-        border-color: #1e7a9a !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Styles are minified once per process (page_styles.style_tag) and re-sent in one element
+st.markdown(
+    style_tag(PRIMARY_BUTTON_CSS, DARK_MODE_CSS) if st.session_state.dark_mode else style_tag(PRIMARY_BUTTON_CSS),
+    unsafe_allow_html=True
+)
 
 st.title("📝 Story Outline Builder")
 
@@ -314,7 +268,8 @@ with col1:
     story_idea = st.text_area(
         "Enter the premise or partial story description:",
         placeholder="Example: A young botanist discovers a glowing plant in the forest...",
-        height=200
+        height=200,
+        key="story_idea_input"
     )
     # Store in session state for document generation
     if story_idea:
@@ -337,26 +292,58 @@ with col2:
     )
 
 file_text = ""
+file_key = None
+use_full_document = True
+# Uploads longer than this many characters are summarized before prompting
+condense_threshold = 12000
+
+# Extracted text is cached per unique file so reruns don't re-parse the upload.
+# Set OUTLINE_EXTRACTION_CACHE_DIR to also keep extractions on disk.
+@st.cache_resource
+def get_extraction_cache():
+    return ExtractionCache(
+        max_entries=16,
+        disk_dir=os.environ.get("OUTLINE_EXTRACTION_CACHE_DIR")
+    )
 
 if uploaded_file is not None:
     st.success(f"Uploaded: {uploaded_file.name}")
 
-    # Read file based on type
-    if uploaded_file.type == "text/plain":
-        file_text = uploaded_file.read().decode("utf-8")
-
-    elif uploaded_file.type == "application/pdf":
-        import PyPDF2
-        reader = PyPDF2.PdfReader(uploaded_file)
-        file_text = "\n".join([page.extract_text() for page in reader.pages])
-
-    elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        import docx
-        doc = docx.Document(uploaded_file)
-        file_text = "\n".join([p.text for p in doc.paragraphs])
+    extraction_cache = get_extraction_cache()
+    file_bytes = uploaded_file.getvalue()
+    file_key = f"{file_digest(file_bytes)}-{max_extract_chars}"
+    file_text = extraction_cache.get(file_key)
+    if file_text is None:
+        # Extract page by page so the first text shows up before parsing finishes
+        progress = st.progress(0.0, text="Extracting text...")
+        preview = st.empty()
+        parts = []
+        with span("upload.extract"):
+            for chunk, fraction in iter_extracted_text(file_bytes, uploaded_file.type, max_chars=max_extract_chars):
+                parts.append(chunk)
+                if len(parts) == 1:
+                    preview.text(chunk[:1000])
+                progress.progress(fraction, text="Extracting text...")
+        progress.empty()
+        preview.empty()
+        file_text = "".join(parts)
+        extraction_cache.put(file_key, file_text)
+
+    if len(file_text) >= max_extract_chars:
+        st.warning(f"Only the first {max_extract_chars:,} characters of this document were extracted.")
+
+    cache_stats = extraction_cache.stats()
+    st.caption(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
     st.text_area("Extracted Document Text:", value=file_text, height=200)
 
+    if len(file_text) > condense_threshold:
+        use_full_document = st.checkbox(
+            "Send the full document text to the model",
+            value=False,
+            help="Long documents are condensed into a summary before being used in prompts. Check this to send the original text instead."
+        )
+
 # -------------------------
 # 2. Connect to LLM API to make the og outline
 # -------------------------
@@ -365,8 +352,71 @@ if uploaded_file is not None:
 api_key = ""
 #MODEL NAME GOES HERE
 model = "gpt-4o" 
+#SAMPLING TEMPERATURE
+temperature = 0.8
+#MAX ESTIMATED TOKENS OF STORY MATERIAL (IDEA + DOCUMENT) PER PROMPT
+prompt_token_budget = 24000
+#SECONDS TO WAIT FOR ALL SELECTED ACTS WHEN REGENERATING THEM (ACTS NOT BACK BY THEN KEEP THEIR BEATS)
+act_regen_timeout = 90
+#SECONDS TO WAIT FOR ANY SINGLE LLM REQUEST (AND TO CONNECT)
+request_timeout = 120
+connect_timeout = 10
+#RETRIES ON RATE LIMITS (429), SERVER ERRORS (5xx) AND DROPPED CONNECTIONS
+max_retries = 4
+#SEND A DUPLICATE REQUEST WHEN ONE TAKES LONGER THAN THE RECENT p95 LATENCY
+hedge_requests = False
+
+# One client (and HTTP connection pool) per process, reused across reruns
+# and sessions instead of being rebuilt on every rerun. Retries are done by
+# LLMClient with jittered backoff, so the SDK's own retries are turned off.
+# The SDK is imported when the first request is made, not at startup.
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key, request_timeout, connect_timeout):
+    import httpx
+    from openai import OpenAI
+    return OpenAI(
+        api_key=api_key or os.environ.get("OPENAI_API_KEY", ""),
+        timeout=httpx.Timeout(request_timeout, connect=connect_timeout),
+        max_retries=0,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60)
+        ),
+    )
+
+# Latency percentiles for hedging are shared by all sessions
+@st.cache_resource
+def get_hedge_policy():
+    return HedgePolicy(percentile=0.95)
+
+
+# Completed responses are cached on disk, keyed on the normalized prompt,
+# model and temperature. Set OUTLINE_RESPONSE_CACHE to move the database.
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        os.environ.get("OUTLINE_RESPONSE_CACHE", os.path.join(".outline_cache", "responses.sqlite3")),
+        ttl_seconds=7 * 24 * 3600,
+        max_entries=1000
+    )
+
+response_cache = get_response_cache()
 
-client = OpenAI(api_key=api_key) #might not need this line
+# The client is created on the first request, which may run on a job thread
+llm = LLMClient(
+    lambda: get_openai_client(api_key, request_timeout, connect_timeout), model, temperature, response_cache, usage_ledger,
+    retry_policy=RetryPolicy(max_retries=max_retries),
+    hedge_policy=get_hedge_policy() if hedge_requests else None
+)
+
+# Non-streamed generations run as background jobs shared by all sessions:
+# a job survives reruns and reconnects, and identical requests that are
+# already in flight are not sent again. Set OUTLINE_JOB_WORKERS to change
+# how many run at once.
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(max_workers=int(os.environ.get("OUTLINE_JOB_WORKERS", "4")))
+
+job_queue = get_job_queue()
 
 # -------------------------
 # 3. Function: Call LLM
@@ -381,54 +431,308 @@ client = OpenAI(api_key=api_key) #might not need this line
 #     # print("THE FUNCTION THAT CALLS THE LLM GOES HERE!")
 
 #FOR WHEN WE NO LONGER USE API RESPONSE; THIS IS FOR THE LLM CALL
-def call_llm(prompt: str) -> str:
-    completion = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful story outline assistant. When creating stories, promote diversity and inclusive representation of characters across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.8,
-    )
-    return completion.choices[0].message.content
+# Messages come from prompts.py, which keeps the stable part of every prompt
+# first so providers can serve it from their prompt cache.
+
+def call_llm(messages, timeout=None, response_format=None, call_type="other") -> str:
+    return llm.complete(messages, timeout=timeout, response_format=response_format, call_type=call_type, use_cache=not bypass_cache)
+
+def call_llm_stream(messages, call_type="other"):
+    """Same request as call_llm, but yields the completion text as it arrives."""
+    return llm.stream(messages, call_type=call_type, use_cache=not bypass_cache)
 
 # -------------------------
 # 4. Generate Visual Outline with Editable Sections
 # -------------------------
 
 # Initialize session state for storing outline sections and version history
-if 'full_outline' not in st.session_state:
-    st.session_state.full_outline = ""
-if 'act1_beats' not in st.session_state:
-    st.session_state.act1_beats = []
-if 'act2_beats' not in st.session_state:
-    st.session_state.act2_beats = []
-if 'act3_beats' not in st.session_state:
-    st.session_state.act3_beats = []
+# (the beats themselves are in st.session_state.outline, see above)
 if 'outline_generated' not in st.session_state:
     st.session_state.outline_generated = False
-# Version history: list of dicts with keys 'timestamp', 'outline', 'act1_beats', 'act2_beats', 'act3_beats'
+# Version history: delta-encoded and capped at MAX_VERSIONS; the history panel
+# reads one page of metadata() and the get_acts() of the version it previews
 if 'outline_versions' not in st.session_state:
-    st.session_state.outline_versions = []
-if 'selected_version_idx' not in st.session_state:
-    st.session_state.selected_version_idx = None
+    st.session_state.outline_versions = VersionStore(max_versions=MAX_VERSIONS)
 if 'plot_points_per_act' not in st.session_state:
     st.session_state.plot_points_per_act = 3
+# Background jobs whose beats still have to be applied: {'job_id', 'acts', 'label', ...}
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []
+# Identifies this session to the job queue, so cancelling only withdraws this session
+if 'job_subscriber' not in st.session_state:
+    st.session_state.job_subscriber = uuid.uuid4().hex
 
 def _construct_full_outline_from_beats():
-    act1_text = "\n".join([f"- {b}" for b in st.session_state.get('act1_beats', [])])
-    act2_text = "\n".join([f"- {b}" for b in st.session_state.get('act2_beats', [])])
-    act3_text = "\n".join([f"- {b}" for b in st.session_state.get('act3_beats', [])])
-    return f"Act I - Setup\n{act1_text}\n\nAct II - Rising Action\n{act2_text}\n\nAct III - Climax & Resolution\n{act3_text}"
+    return st.session_state.outline.text()
 
 
-def _update_version_labels():
-    # enforce label format: store just timestamp; UI will add index
-    for i, v in enumerate(st.session_state.outline_versions):
-        ts = v.get('timestamp') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        st.session_state.outline_versions[i]['label'] = ts
+@st.cache_resource
+def get_summary_cache():
+    return ExtractionCache(
+        max_entries=16,
+        disk_dir=os.environ.get("OUTLINE_SUMMARY_CACHE_DIR")
+    )
+
+
+def _summarize_chunk(chunk):
+    return call_llm(summary_messages(chunk), call_type="summarize")
 
 
+def _document_text():
+    """Uploaded text as used in prompts: condensed once per document when it is long.
+
+    The map-reduce summary is cached per document hash; the original text is
+    only sent when the user asks for it (or condensing fails).
+    """
+    if not file_text or use_full_document or len(file_text) <= condense_threshold:
+        return file_text
+    summary_cache = get_summary_cache()
+    summary_key = f"{file_key}-{model}"
+    summary = summary_cache.get(summary_key)
+    if summary is None:
+        try:
+            with st.spinner("Condensing the uploaded document..."):
+                summary = condense_document(file_text, _summarize_chunk, timeout=act_regen_timeout)
+        except RuntimeError as e:
+            st.warning(f"Could not condense the document, using the full text instead: {e}")
+            return file_text
+        summary_cache.put(summary_key, summary)
+    return summary
+
+
+def _story_material():
+    """Story idea plus (possibly condensed) uploaded text, trimmed to the prompt token budget."""
+    material = (story_idea or "") + "\n\n" + (_document_text() or "")
+    trimmed = trim_to_token_budget(material, prompt_token_budget, model)
+    if trimmed is not material:
+        st.toast(f"Story material was trimmed to about {prompt_token_budget:,} tokens to fit the prompt budget.")
+    return trimmed
+
+
+def _build_act_prompt(act):
+    """Prompt for regenerating a single act from the story and the current outline."""
+    return regenerate_act_prompt(_story_material(), _construct_full_outline_from_beats(), act, st.session_state.plot_points_per_act)
+
+
+def _request_outline(prompt, timeout=None):
+    """Beats for the acts `prompt` asks for, capped to its beats per act.
+
+    Sent to the outline service when one is configured, otherwise to the
+    LLM from here. With structured output on, the model is asked for a
+    schema-constrained JSON object, falling back to the plain-text prompt.
+    """
+    if outline_service is not None:
+        return outline_service.request_outline(
+            prompt, model, temperature, structured=structured_output, use_cache=not bypass_cache, timeout=timeout
+        )
+    return llm.request_outline(
+        prompt, prompt.acts, structured_output, timeout=timeout, call_type=prompt.call_type, use_cache=not bypass_cache
+    )
+
+
+def _request_outline_candidates(prompt, n, timeout=None):
+    """`n` alternative outlines for `prompt`, from one request where the provider allows it."""
+    if outline_service is not None:
+        return outline_service.request_outline_candidates(
+            prompt, n, model, temperature, structured=structured_output, timeout=timeout
+        )
+    return llm.request_outline_candidates(
+        prompt, n, prompt.acts, structured_output, timeout=timeout, call_type=prompt.call_type
+    )
+
+
+def _job_key(*parts):
+    """Dedup key for a job: its prompts plus the settings that change the answer."""
+    return hashlib.sha256(json.dumps(
+        [*parts, model, temperature, structured_output, bool(outline_service)], sort_keys=True
+    ).encode("utf-8")).hexdigest()
+
+
+def _track_job(fn, key, acts, label, **kind):
+    """Submit `fn` for this session and remember it until its result is applied."""
+    job = job_queue.submit(fn, key=key, label=label, subscriber=st.session_state.job_subscriber)
+    if all(pending['job_id'] != job.id for pending in st.session_state.pending_jobs):
+        st.session_state.pending_jobs.append({'job_id': job.id, 'acts': acts, 'label': label, **kind})
+
+
+def _submit_outline_job(prompt, label, timeout=None, candidates=1):
+    """Queue `prompt` on the job queue; its beats are applied once the job finishes.
+
+    With more than one candidate the job returns a list of outlines, which
+    are offered for picking instead of being applied.
+    """
+    if candidates > 1:
+        fn = lambda job: _request_outline_candidates(prompt, candidates, timeout=timeout)
+    else:
+        fn = lambda job: _request_outline(prompt, timeout=timeout)
+    key = _job_key(prompt.kind, prompt.params, candidates)
+    _track_job(fn, key, prompt.acts, label, candidates=candidates > 1)
+
+
+def _submit_acts_job(acts, label, timeout):
+    """Regenerate `acts` concurrently in one job with a `timeout` deadline.
+
+    The job returns {act: (outline, error)}; acts that fail or are not back
+    in time keep their current beats, and the rest are applied together.
+    """
+    prompts = {act: _build_act_prompt(act) for act in acts}
+    fn = lambda job: run_parallel(
+        {act: (lambda p=p: _request_outline(p, timeout=timeout)) for act, p in prompts.items()},
+        timeout=timeout
+    )
+    key = _job_key([[p.kind, p.params] for p in prompts.values()])
+    _track_job(fn, key, list(acts), label, per_act=True)
+
+
+def _apply_finished_jobs():
+    """Copy the beats of finished jobs into the outline and report failures.
+
+    Reruns the script when anything was applied, so the parts of the page
+    drawn before this point (sidebar export) see the new beats too.
+    """
+    notices = []
+    still_pending = []
+    for pending in st.session_state.pending_jobs:
+        job = job_queue.get(pending['job_id'])
+        if job is not None and not job.done:
+            still_pending.append(pending)
+            continue
+        acts = pending['acts']
+        if job is None:
+            # Evicted from the queue's finished jobs before this session polled it
+            notices.append(("error", f"{pending['label']}: the result was lost before it could be applied. Please try again."))
+        elif job.status == DONE and pending.get('per_act'):
+            errors = {}
+            for act, (outline, error) in job.result.items():
+                if error is not None:
+                    errors[act] = str(error) or type(error).__name__
+                else:
+                    st.session_state.outline.set_act(act, outline.beats(act))
+            st.session_state.act_regen_errors = errors
+            if len(errors) < len(acts):
+                notices.append(("success", f"✅ {pending['label']} finished"))
+        elif job.status == DONE and pending.get('candidates'):
+            for i, candidate in enumerate(job.result, start=1):
+                _save_version((candidate.act1, candidate.act2, candidate.act3), label=f"candidate {i}/{len(job.result)}")
+            st.session_state.outline_candidates = job.result
+            notices.append(("success", f"✅ {len(job.result)} candidate outlines ready"))
+        elif job.status == DONE:
+            for act in acts:
+                st.session_state.outline.set_act(act, job.result.beats(act))
+            if len(acts) == 3:
+                st.session_state.outline_generated = True
+            notices.append(("success", f"✅ {pending['label']} finished"))
+        elif job.status == FAILED:
+            error = str(job.error) or type(job.error).__name__
+            if len(acts) == 1:
+                st.session_state.act_regen_errors = {**st.session_state.get('act_regen_errors', {}), acts[0]: error}
+            else:
+                notices.append(("error", f"{pending['label']} failed: {error}"))
+    if len(still_pending) != len(st.session_state.pending_jobs):
+        st.session_state.pending_jobs = still_pending
+        st.session_state.job_notices = notices
+        st.rerun()
+
+
+@st.fragment(run_every=1.0)
+def _job_progress():
+    """Progress of this session's background jobs, polled every second."""
+    pending_jobs = st.session_state.pending_jobs
+    if any(job_queue.get(p['job_id']) is None or job_queue.get(p['job_id']).done for p in pending_jobs):
+        # Apply the results in a full rerun
+        st.rerun()
+    for pending in pending_jobs:
+        job = job_queue.get(pending['job_id'])
+        col_status, col_cancel = st.columns([5, 1])
+        status = job.progress or job.status
+        col_status.info(f"⏳ {pending['label']}: {status} ({job.elapsed:.0f}s)")
+        if col_cancel.button("✖ Cancel", key=f"cancel_job_{job.id}", use_container_width=True):
+            job_queue.cancel(job.id, st.session_state.job_subscriber)
+            st.session_state.pending_jobs = [p for p in pending_jobs if p['job_id'] != job.id]
+            st.rerun()
+
+
+def _persist_outline():
+    """Queue the project's state for saving if it changed since the last save.
+
+    Called at the end of every full run and by the act editors, whose
+    reruns don't reach the end of the script. The store debounces and
+    batches the writes, so a burst of edits ends up as one write.
+    """
+    outline = st.session_state.outline
+    story_idea_text = st.session_state.get('story_idea_input', "")
+    version = (outline.revision, st.session_state.outline_generated, st.session_state.plot_points_per_act, story_idea_text)
+    if st.session_state.get('persisted_version') == version:
+        return
+    act1, act2, act3 = outline.acts()
+    outline_store.save_outline(st.session_state.project_id, {
+        'act1_beats': list(act1),
+        'act2_beats': list(act2),
+        'act3_beats': list(act3),
+        'outline_generated': st.session_state.outline_generated,
+        'plot_points_per_act': st.session_state.plot_points_per_act,
+        'story_idea': story_idea_text
+    })
+    st.session_state.persisted_version = version
+
+
+def _save_version(acts=None, label=None):
+    """Snapshot `acts` (default: the current beats, if any outline exists) into the version history."""
+    if acts is None:
+        if not st.session_state.outline_generated:
+            return
+        acts = st.session_state.outline.acts()
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    label = label and f"{ts} ({label})"
+    st.session_state.outline_versions.append(*acts, timestamp=ts, label=label)
+    outline_store.append_version(st.session_state.project_id, ts, acts, label)
+
+
+def _stream_into_acts(prompt, placeholders, max_beats, target_act=None, call_type="generate"):
+    """Stream an LLM response into the beat lists of the acts in `placeholders`.
+
+    Beats are rendered into each act's placeholder as they arrive and written
+    to the outline model as soon as they are complete, so a Stop click (which
+    interrupts the script run) keeps everything generated up to that point.
+    Returns the full completion text.
+    """
+    outline = st.session_state.outline
+    parser = OutlineStreamParser(target_act=target_act)
+    for act in placeholders:
+        outline.set_act(act, [])
+
+    def _render(act):
+        beats = outline.beats(act)
+        lines = [f"- {b}" for b in beats]
+        partial = parser.partial_beat()
+        if partial and parser.current_act == act and len(beats) < max_beats:
+            lines.append(f"- {partial} ▌")
+        placeholders[act].markdown("\n".join(lines) or "_Waiting for beats..._")
+
+    def _add(items):
+        for act, beat in items:
+            if act in placeholders and len(outline.beats(act)) < max_beats:
+                outline.append_beat(act, beat)
+
+    for act in placeholders:
+        _render(act)
+
+    parts = []
+    for delta in call_llm_stream(prompt.messages(), call_type=call_type):
+        parts.append(delta)
+        previous_act = parser.current_act
+        _add(parser.feed(delta))
+        for act in {previous_act, parser.current_act}:
+            if act in placeholders:
+                _render(act)
+    _add(parser.close())
+    for act in placeholders:
+        _render(act)
+    return "".join(parts)
+
+
+ACT_EXPANDER_TITLES = {1: "📖 Act I - Setup", 2: "🎬 Act II - Rising Action", 3: "🎯 Act III - Climax & Resolution"}
+ACT_NUMERALS = {1: "I", 2: "II", 3: "III"}
 
 if st.button("🎬 Generate Complete Story Outline", type="primary"):
     if not story_idea and not file_text:
@@ -437,145 +741,178 @@ if st.button("🎬 Generate Complete Story Outline", type="primary"):
         # Store the plot points preference
         st.session_state.plot_points_per_act = plot_points_per_act
         
-        combined_text = (story_idea or "") + "\n\n" + (file_text or "")
-        
-        # Create example beats based on the selected number
-        example_beats = "\n".join([f"                - Key beat {i+1}" for i in range(plot_points_per_act)])
-
-        prompt = f"""
-            Create a clear, detailed, visual story outline based on the following material:
-
-            {combined_text}
-
-            Your outline must follow this format with EXACTLY {plot_points_per_act} plot points per act:
-
-            - Act I
-            - Setup
-{example_beats}
-            - Act II
-            - Rising Action
-{example_beats}
-            - Act III
-            - Climax & Resolution
-{example_beats}
-
-            Guidelines:
-            - Use hierarchical bullet formatting.
-            - Provide EXACTLY {plot_points_per_act} key beats for each act.
-            - Do NOT include a summary or explanations.
-            - Keep the outline tight and structured like a screenplay or novel planner.
-            - Focus purely on plot beats and story flow.
-            - Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology.
-            """
-
-        with st.spinner("Generating outline..."):
-            print(prompt)
-            result = call_llm(prompt)
+        prompt = generate_outline_prompt(_story_material(), plot_points_per_act)
+
+        if use_streaming and candidate_count == 1:
+            # Save current version before overwriting (if any outline exists)
+            _save_version()
 
+            st.session_state.outline_generated = True
+            st.button("⏹ Stop Generating", key="stop_generate_stream")
+            act_placeholders = {}
+            for act, act_title in ACT_EXPANDER_TITLES.items():
+                with st.expander(act_title, expanded=True):
+                    act_placeholders[act] = st.empty()
+            _stream_into_acts(prompt, act_placeholders, plot_points_per_act)
+            st.success("✅ Outline generated! You can now edit individual sections below.")
+        else:
             #FOR API CALL
             # st.subheader("📘 Generated Story Outline")
             # st.markdown(combined_text)
 
             # Save current version before overwriting (if any outline exists)
-            if st.session_state.full_outline.strip():
-                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                st.session_state.outline_versions.append({
-                    'timestamp': ts,
-                    'outline': st.session_state.full_outline,
-                    'act1_beats': st.session_state.act1_beats[:],
-                    'act2_beats': st.session_state.act2_beats[:],
-                    'act3_beats': st.session_state.act3_beats[:]
-                })
-                _update_version_labels()
-
-            st.session_state.full_outline = result #stores outline into current session
-            st.session_state.outline_generated = True #marks outline as generated
-
-            # Parse the outline into individual beats
-            def parse_beats(text):
-                """Extract individual beats from outline text, filtering out headers."""
-                lines = text.split('\n')
-                beats = []
-                structural_keywords = ['setup', 'rising action', 'climax', 'resolution', 'climax & resolution', 'climax and resolution']
-                
-                for line in lines:
-                    line = line.strip()
-                    # Skip empty lines
-                    if not line:
-                        continue
-                    
-                    # Skip lines that start with "- **" (bold headers)
-                    if line.startswith('- **') and line.endswith('**'):
-                        continue
-                    
-                    # Extract actual beat content (remove bullet markers)
-                    if line.startswith('- '):
-                        beat = line[2:].strip()
-                    else:
-                        beat = line
-                    
-                    # Skip structural headers (check after removing bullet)
-                    if beat.lower() in structural_keywords:
-                        continue
-                    
-                    # Remove "Key beat X:" prefix if present
-                    if beat.lower().startswith('key beat'):
-                        if ':' in beat:
-                            beat = beat.split(':', 1)[1].strip()
-                        else:
-                            continue
-                    
-                    if beat:
-                        beats.append(beat)
-                return beats
-
-            # Split into per-act raw text and parse into beats
-            lines = result.split('\n')
-            act1_text = []
-            act2_text = []
-            act3_text = []
-            current_act = 0
-
-            for line in lines:
-                line_stripped = line.strip()
-                line_lower = line_stripped.lower()
-                if 'act i' in line_lower and 'act ii' not in line_lower and 'act iii' not in line_lower:
-                    current_act = 1
-                    continue
-                elif 'act ii' in line_lower and 'act iii' not in line_lower:
-                    current_act = 2
-                    continue
-                elif 'act iii' in line_lower:
-                    current_act = 3
-                    continue
-                if current_act == 1:
-                    act1_text.append(line)
-                elif current_act == 2:
-                    act2_text.append(line)
-                elif current_act == 3:
-                    act3_text.append(line)
-
-            st.session_state.act1_beats = parse_beats('\n'.join(act1_text))
-            st.session_state.act2_beats = parse_beats('\n'.join(act2_text))
-            st.session_state.act3_beats = parse_beats('\n'.join(act3_text))
-            
-
-            # Cap beats to the specified number of plot points per act
-            max_beats = st.session_state.plot_points_per_act
-            st.session_state.act1_beats = st.session_state.act1_beats[:max_beats]
-            st.session_state.act2_beats = st.session_state.act2_beats[:max_beats]
-            st.session_state.act3_beats = st.session_state.act3_beats[:max_beats]
-
-            # After generating, set selected_version_idx to None (current)
-            st.session_state.selected_version_idx = None
-
-        st.success("✅ Outline generated! You can now edit individual sections below.")
+            _save_version()
+
+            # Beats (already capped to the requested plot points per act) are
+            # applied by _apply_finished_jobs once the job is done
+            if candidate_count > 1:
+                _submit_outline_job(prompt, f"Generating {candidate_count} candidate outlines", candidates=candidate_count)
+            else:
+                _submit_outline_job(prompt, "Generating outline")
+        st.rerun()
+
+_apply_finished_jobs()
+for kind, message in st.session_state.pop('job_notices', []):
+    if kind == "error":
+        st.error(message)
+    else:
+        st.toast(message)
+if st.session_state.pending_jobs:
+    _job_progress()
+
+if st.session_state.get('outline_candidates'):
+    # Candidates side by side; picking one replaces the outline (all of them are in the version history)
+    candidates = st.session_state.outline_candidates
+    st.subheader("🎲 Pick an outline")
+    for i, (column, candidate) in enumerate(zip(st.columns(len(candidates)), candidates), start=1):
+        with column:
+            st.markdown(f"**Candidate {i}**")
+            for act, section_name in ACT_SECTION_NAMES.items():
+                st.markdown(f"*{section_name}*")
+                st.markdown("\n".join(f"- {beat}" for beat in candidate.beats(act)) or "_No beats_")
+            if st.button("✅ Use this outline", key=f"use_candidate_{i}", use_container_width=True):
+                st.session_state.outline.set_acts(candidate.act1, candidate.act2, candidate.act3)
+                st.session_state.outline_generated = True
+                del st.session_state.outline_candidates
+                st.rerun()
+    if st.button("Dismiss candidates"):
+        del st.session_state.outline_candidates
         st.rerun()
 
 # -------------------------
 # 5. Editable Outline Sections (Linear Layout) + Version History UI
 # -------------------------
 
+
+VERSIONS_PER_PAGE = 10
+
+
+@st.fragment
+@span("render.version_history")
+def _version_history_panel():
+    """Paged version picker with a read-only preview; browsing reruns only this panel.
+
+    Only the labels of the page on screen are built, and only the beats of
+    the version being previewed are restored.
+    """
+    st.markdown("**📚 Version History**")
+    versions = st.session_state.outline_versions
+    total = len(versions)
+    pages = max((total + VERSIONS_PER_PAGE - 1) // VERSIONS_PER_PAGE, 1)
+    page = min(st.session_state.get('version_page', 0), pages - 1)
+
+    # Newest first: page 0 holds the latest versions
+    stop = total - page * VERSIONS_PER_PAGE
+    entries = versions.metadata(max(stop - VERSIONS_PER_PAGE, 0), stop)[::-1]
+    labels = {e['index']: f"{e['index'] + 1}: {e['label']} ({sum(e['sizes'])} beats)" for e in entries}
+    options = ([None] if st.session_state.outline_generated else []) + list(labels)
+
+    if pages > 1:
+        col_newer, col_page, col_older = st.columns([1, 2, 1])
+        if col_newer.button("◀", key="version_page_newer", disabled=page == 0, use_container_width=True):
+            st.session_state.version_page = page - 1
+            st.rerun(scope="fragment")
+        col_page.caption(f"Page {page + 1} of {pages} ({total} versions)")
+        if col_older.button("▶", key="version_page_older", disabled=page == pages - 1, use_container_width=True):
+            st.session_state.version_page = page + 1
+            st.rerun(scope="fragment")
+
+    idx = st.selectbox(
+        "Select version:",
+        options,
+        format_func=lambda i: "Current" if i is None else labels[i],
+        key=f"version_select_{page}",
+        label_visibility="collapsed"
+    )
+    if idx is None:
+        return
+
+    acts = versions.get_acts(idx)
+    st.info(f"Viewing version {labels[idx]}. To restore, click below.")
+
+    if st.button("Restore This Version", key=f"restore_{idx}", use_container_width=True):
+        st.session_state.outline.set_acts(*acts)
+        st.session_state.outline_generated = True
+        st.rerun()
+
+    compare = st.session_state.outline_generated and st.toggle(
+        "Compare with current outline",
+        key="version_compare",
+        help="Highlight what changed between this version and the current outline"
+    )
+    if compare:
+        # Cached per pair of outlines, so flipping between versions doesn't diff again
+        act_diffs = diff_outlines(
+            tuple(map(tuple, acts)), tuple(map(tuple, st.session_state.outline.acts()))
+        )
+        counts = diff_counts(act_diffs)
+        st.caption(f"Since this version: {counts['insert']} beats added, {counts['delete']} removed, {counts['change']} edited")
+
+    # Read-only preview as plain markdown, so browsing creates no widgets per beat
+    for act, act_title in ACT_EXPANDER_TITLES.items():
+        with st.expander(act_title, expanded=True):
+            if compare:
+                st.markdown(act_diff_html(act_diffs[act - 1]), unsafe_allow_html=True)
+            else:
+                st.markdown("\n".join(f"{i}. {beat}" for i, beat in enumerate(acts[act - 1], start=1)) or "_No beats_")
+
+
+@st.fragment
+@span("render.act_editor")
+def _act_editor(act):
+    """Beat editors and Regenerate button of one act.
+
+    Typing in a beat reruns only this act; the edit goes straight into the
+    act's beat list and is persisted from here.
+    """
+    outline = st.session_state.outline
+    beats = outline.beats(act)
+    with st.expander(ACT_EXPANDER_TITLES[act], expanded=True):
+        edited = False
+        for i in range(len(beats)):
+            value = st.text_area(
+                f"Beat {i+1}:",
+                value=beats[i],
+                height=80,
+                key=f"act{act}_beat_{i}",
+                label_visibility="collapsed"
+            )
+            edited = outline.set_beat(act, i, value) or edited
+        if edited:
+            _persist_outline()
+
+        if st.button(f"🔄 Regenerate Act {ACT_NUMERALS[act]}", key=f"regen_act{act}"):
+            _save_version()
+
+            prompt = _build_act_prompt(act)
+            if use_streaming:
+                st.button("⏹ Stop", key=f"stop_act{act}_stream")
+                _stream_into_acts(prompt, {act: st.empty()}, st.session_state.plot_points_per_act, target_act=act, call_type=f"regenerate-act-{act}")
+            else:
+                _submit_outline_job(prompt, f"Regenerating Act {ACT_NUMERALS[act]}")
+            st.rerun()
+
+
 if st.session_state.outline_generated or st.session_state.outline_versions:
     st.subheader("📘 Edit Your Story Outline")
     
@@ -598,329 +935,61 @@ if st.session_state.outline_generated or st.session_state.outline_versions:
                 st.error("Please provide instructions for regenerating the outline.")
             else:
                 # Save a version before regenerating
-                if st.session_state.full_outline.strip():
-                    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    st.session_state.outline_versions.append({
-                        'timestamp': ts,
-                        'outline': st.session_state.full_outline,
-                        'act1_beats': st.session_state.act1_beats[:],
-                        'act2_beats': st.session_state.act2_beats[:],
-                        'act3_beats': st.session_state.act3_beats[:]
-                    })
-                    _update_version_labels()
+                _save_version()
                 # include current outline and user edits in the prompt
-                current_outline_text = _construct_full_outline_from_beats()
-                combined_text = (story_idea or "") + "\n\n" + (file_text or "") + "\n\nCurrent Outline:\n" + current_outline_text
-                prompt = f"""
-                    Create a clear, detailed, visual story outline based on the following material:
-
-                    {combined_text}
-
-                    Additional instructions for this regeneration:
-                    {regenerate_prompt}
-
-                    Your outline must follow this format:
-
-                    - Act I
-                    - Setup
-                        - Key beat 1
-                        - Key beat 2
-                    - Act II
-                    - Rising Action
-                        - Key beat 1
-                        - Key beat 2
-                    - Act III
-                    - Climax & Resolution
-                        - Key beat 1
-                        - Key beat 2
-
-                    Guidelines:
-                    - Use hierarchical bullet formatting.
-                    - Do NOT include a summary or explanations.
-                    - Keep the outline tight and structured like a screenplay or novel planner.
-                    - Focus purely on plot beats and story flow.
-                    - Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology.
-                    """
-
-                with st.spinner("Regenerating complete outline..."):
-                    result = call_llm(prompt)
-                    st.session_state.full_outline = result
-                    
-                    # Reuse the parse_beats function from the initial generation
-                    def parse_beats(text):
-                        """Extract individual beats from outline text, filtering out headers."""
-                        lines = text.split('\n')
-                        beats = []
-                        
-                        for line in lines:
-                            line = line.strip()
-                            # Skip empty lines
-                            if not line:
-                                continue
-                            
-                            # Skip structural headers (but be more specific)
-                            line_lower = line.lower()
-                            if line_lower in ['setup', 'rising action', 'climax', 'resolution', 'climax & resolution', 'climax and resolution']:
-                                continue
-                            if line.startswith('- **') and line.endswith('**'):
-                                # This is a bold header like "- **Setup**"
-                                continue
-                            
-                            # Extract actual beat content (remove bullet markers)
-                            if line.startswith('- '):
-                                beat = line[2:].strip()
-                                # Remove "Key beat X:" prefix if present
-                                if beat.lower().startswith('key beat'):
-                                    # Find the colon and take everything after it
-                                    if ':' in beat:
-                                        beat = beat.split(':', 1)[1].strip()
-                                    else:
-                                        continue  # Skip if it's just "Key beat X" without content
-                                if beat:  # Only add non-empty beats
-                                    beats.append(beat)
-                        return beats
-                    
-                    # Parse the outline into sections
-                    lines = result.split('\n')
-                    act1_text = []
-                    act2_text = []
-                    act3_text = []
-                    current_act = 0
-
-                    for line in lines:
-                        line_stripped = line.strip()
-                        line_lower = line_stripped.lower()
-                        
-                        # Check for Act transitions - be more flexible
-                        if 'act i' in line_lower and 'act ii' not in line_lower and 'act iii' not in line_lower:
-                            current_act = 1
-                            continue  # Don't add the act header line itself
-                        elif 'act ii' in line_lower and 'act iii' not in line_lower:
-                            current_act = 2
-                            continue  # Don't add the act header line itself
-                        elif 'act iii' in line_lower:
-                            current_act = 3
-                            continue  # Don't add the act header line itself
-                        
-                        # Assign line to current act
-                        if current_act == 1:
-                            act1_text.append(line)
-                        elif current_act == 2:
-                            act2_text.append(line)
-                        elif current_act == 3:
-                            act3_text.append(line)
-
-                    st.session_state.act1_beats = parse_beats('\n'.join(act1_text))
-                    st.session_state.act2_beats = parse_beats('\n'.join(act2_text))
-                    st.session_state.act3_beats = parse_beats('\n'.join(act3_text))
-                    
-                st.success("✅ Outline regenerated successfully!")
+                prompt = regenerate_outline_prompt(
+                    _story_material(),
+                    _construct_full_outline_from_beats(),
+                    regenerate_prompt,
+                    st.session_state.plot_points_per_act
+                )
+
+                if use_streaming:
+                    st.button("⏹ Stop Regenerating", key="stop_regenerate_stream")
+                    act_placeholders = {}
+                    for act, act_title in ACT_EXPANDER_TITLES.items():
+                        with st.expander(act_title, expanded=True):
+                            act_placeholders[act] = st.empty()
+                    _stream_into_acts(prompt, act_placeholders, st.session_state.plot_points_per_act, call_type="regenerate-all")
+                    st.success("✅ Outline regenerated successfully!")
+                else:
+                    _submit_outline_job(prompt, "Regenerating complete outline")
                 st.rerun()
         
-        # Version History (below regenerate section)
+        # Regenerate Selected Acts (one background job that requests the acts concurrently)
         st.divider()
-        st.markdown("**📚 Version History**")
-        version_options = [f"{i+1}: {v.get('label', v.get('timestamp',''))}" for i, v in enumerate(st.session_state.outline_versions)]
-        if st.session_state.outline_generated:
-            version_options.append("Current")
-
-        selected = st.selectbox(
-            "Select version:",
-            version_options,
-            index=len(version_options)-1 if version_options else 0,
-            key="version_selectbox",
+        st.markdown("**🎭 Regenerate Selected Acts**")
+        for act, error in st.session_state.pop('act_regen_errors', {}).items():
+            st.warning(f"{ACT_SECTION_NAMES[act]} was not regenerated: {error}")
+        selected_acts = st.multiselect(
+            "Acts to regenerate:",
+            [1, 2, 3],
+            default=[1, 2, 3],
+            format_func=lambda act: ACT_SECTION_NAMES[act],
+            key="regen_selected_acts",
             label_visibility="collapsed"
         )
-
-    # If user selects a previous version, load its content into the editors (read-only)
-    if selected != "Current":
-        # parse index from option like '1: label'
-        try:
-            idx = int(selected.split(":")[0].strip()) - 1
-        except Exception:
-            idx = 0
-        v = st.session_state.outline_versions[idx]
-        st.info(f"Viewing version {idx+1}: {v.get('label', v.get('timestamp'))}. To restore, click below.")
-
-        if st.button("Restore This Version", key=f"restore_{idx}"):
-            st.session_state.full_outline = v['outline']
-            st.session_state.act1_beats = v.get('act1_beats', [])
-            st.session_state.act2_beats = v.get('act2_beats', [])
-            st.session_state.act3_beats = v.get('act3_beats', [])
-            st.session_state.outline_generated = True
-            st.session_state.selected_version_idx = None
-            st.success("Restored selected version. You can now edit and save as a new version.")
-            st.rerun()
-
-        # Show the outline sections as read-only
-        with st.expander("📖 Act I - Setup", expanded=True):
-            for i, beat in enumerate(v.get('act1_beats', [])):
-                st.text_area(f"Beat {i+1}:", value=beat, height=80, key=f"act1_beat{i}_view_{idx}", disabled=True, label_visibility="collapsed")
-        with st.expander("🎬 Act II - Rising Action", expanded=True):
-            for i, beat in enumerate(v.get('act2_beats', [])):
-                st.text_area(f"Beat {i+1}:", value=beat, height=80, key=f"act2_beat{i}_view_{idx}", disabled=True, label_visibility="collapsed")
-        with st.expander("🎯 Act III - Climax & Resolution", expanded=True):
-            for i, beat in enumerate(v.get('act3_beats', [])):
-                st.text_area(f"Beat {i+1}:", value=beat, height=80, key=f"act3_beat{i}_view_{idx}", disabled=True, label_visibility="collapsed")
-        st.stop()
-
-    # Custom CSS to increase font size in text areas
-    st.markdown("""
-        <style>
-        .stTextArea textarea {
-            font-size: 16px !important;
-            line-height: 1.6 !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    with col_outline:
-        # Act I - Setup
-        with st.expander("📖 Act I - Setup", expanded=True):
-            for i in range(len(st.session_state.act1_beats)):
-                st.session_state.act1_beats[i] = st.text_area(
-                    f"Beat {i+1}:",
-                    value=st.session_state.act1_beats[i],
-                    height=80,
-                    key=f"act1_beat_{i}",
-                    label_visibility="collapsed"
-                )
-            # Regenerate Act I button
-            if st.button("🔄 Regenerate Act I", key="regen_act1"):
-                if st.session_state.full_outline.strip():
-                    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    st.session_state.outline_versions.append({
-                        'timestamp': ts,
-                        'outline': st.session_state.full_outline,
-                        'act1_beats': st.session_state.act1_beats[:],
-                        'act2_beats': st.session_state.act2_beats[:],
-                        'act3_beats': st.session_state.act3_beats[:]
-                    })
-                    _update_version_labels()
-
-                current_outline_text = _construct_full_outline_from_beats()
-                combined_text = (story_idea or "") + "\n\n" + (file_text or "") + "\n\nCurrent Outline:\n" + current_outline_text
-                prompt = f"""Based on this story and the current outline: {combined_text}
-                Generate ONLY Act I - Setup section with {st.session_state.plot_points_per_act} key beats in hierarchical bullet format.
-                Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."""
-                with st.spinner("Regenerating Act I..."):
-                    new_text = call_llm(prompt)
-                def _parse_beats(text):
-                    beats = []
-                    for line in text.split('\n'):
-                        l = line.strip()
-                        if not l:
-                            continue
-                        if l.startswith('- '):
-                            b = l[2:].strip()
-                        else:
-                            b = l
-                        if b.lower().startswith('key beat') and ':' in b:
-                            b = b.split(':',1)[1].strip()
-                        if b:
-                            beats.append(b)
-                    return beats
-                st.session_state.act1_beats = _parse_beats(new_text)
-                st.session_state.act1_beats = st.session_state.act1_beats[:st.session_state.plot_points_per_act]
+        
+        if st.button("🔄 Regenerate Selected Acts", use_container_width=True, key="regen_selected"):
+            if not selected_acts:
+                st.error("Please select at least one act to regenerate.")
+            else:
+                _save_version()
+                
+                label = "Regenerating Acts " + ", ".join(ACT_NUMERALS[act] for act in sorted(selected_acts))
+                _submit_acts_job(sorted(selected_acts), label, act_regen_timeout)
                 st.rerun()
+        
+        # Version History (below regenerate section)
+        st.divider()
+        _version_history_panel()
 
-        # Act II - Rising Action
-        with st.expander("🎬 Act II - Rising Action", expanded=True):
-            for i in range(len(st.session_state.act2_beats)):
-                st.session_state.act2_beats[i] = st.text_area(
-                    f"Beat {i+1}:",
-                    value=st.session_state.act2_beats[i],
-                    height=80,
-                    key=f"act2_beat_{i}",
-                    label_visibility="collapsed"
-                )
-            # Regenerate Act II button
-            if st.button("🔄 Regenerate Act II", key="regen_act2"):
-                if st.session_state.full_outline.strip():
-                    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    st.session_state.outline_versions.append({
-                        'timestamp': ts,
-                        'outline': st.session_state.full_outline,
-                        'act1_beats': st.session_state.act1_beats[:],
-                        'act2_beats': st.session_state.act2_beats[:],
-                        'act3_beats': st.session_state.act3_beats[:]
-                    })
-                    _update_version_labels()
-
-                current_outline_text = _construct_full_outline_from_beats()
-                combined_text = (story_idea or "") + "\n\n" + (file_text or "") + "\n\nCurrent Outline:\n" + current_outline_text
-                prompt = f"""Based on this story and the current outline: {combined_text}
-                Generate ONLY Act II - Rising Action section with {st.session_state.plot_points_per_act} key beats in hierarchical bullet format.
-                Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."""
-                with st.spinner("Regenerating Act II..."):
-                    new_text = call_llm(prompt)
-                def _parse_beats(text):
-                    beats = []
-                    for line in text.split('\n'):
-                        l = line.strip()
-                        if not l:
-                            continue
-                        if l.startswith('- '):
-                            b = l[2:].strip()
-                        else:
-                            b = l
-                        if b.lower().startswith('key beat') and ':' in b:
-                            b = b.split(':',1)[1].strip()
-                        if b:
-                            beats.append(b)
-                    return beats
-                st.session_state.act2_beats = _parse_beats(new_text)
-                st.session_state.act2_beats = st.session_state.act2_beats[:st.session_state.plot_points_per_act]
-                st.rerun()
+    # Larger text in the beat editors
+    st.markdown(style_tag(TEXT_AREA_CSS), unsafe_allow_html=True)
 
-        # Act III - Climax & Resolution
-        with st.expander("🎯 Act III - Climax & Resolution", expanded=True):
-            for i in range(len(st.session_state.act3_beats)):
-                st.session_state.act3_beats[i] = st.text_area(
-                    f"Beat {i+1}:",
-                    value=st.session_state.act3_beats[i],
-                    height=80,
-                    key=f"act3_beat_{i}",
-                    label_visibility="collapsed"
-                )
-            # Regenerate Act III button
-            if st.button("🔄 Regenerate Act III", key="regen_act3"):
-                if st.session_state.full_outline.strip():
-                    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    st.session_state.outline_versions.append({
-                        'timestamp': ts,
-                        'outline': st.session_state.full_outline,
-                        'act1_beats': st.session_state.act1_beats[:],
-                        'act2_beats': st.session_state.act2_beats[:],
-                        'act3_beats': st.session_state.act3_beats[:]
-                    })
-                    _update_version_labels()
-
-                current_outline_text = _construct_full_outline_from_beats()
-                combined_text = (story_idea or "") + "\n\n" + (file_text or "") + "\n\nCurrent Outline:\n" + current_outline_text
-                prompt = f"""Based on this story and the current outline: {combined_text}
-                Generate ONLY Act III - Climax & Resolution section with {st.session_state.plot_points_per_act} key beats in hierarchical bullet format.
-                Promote diversity in characters: include diverse representation across race, ethnicity, gender, sexual orientation, religion, creed, and ideology."""
-                with st.spinner("Regenerating Act III..."):
-                    new_text = call_llm(prompt)
-                def _parse_beats(text):
-                    beats = []
-                    for line in text.split('\n'):
-                        l = line.strip()
-                        if not l:
-                            continue
-                        if l.startswith('- '):
-                            b = l[2:].strip()
-                        else:
-                            b = l
-                        if b.lower().startswith('key beat') and ':' in b:
-                            b = b.split(':',1)[1].strip()
-                        if b:
-                            beats.append(b)
-                    return beats
-                st.session_state.act3_beats = _parse_beats(new_text)
-                st.session_state.act3_beats = st.session_state.act3_beats[:st.session_state.plot_points_per_act]
-                st.rerun()
+    with col_outline:
+        for act in (1, 2, 3):
+            _act_editor(act)
 
 
 
@@ -929,20 +998,37 @@ if st.session_state.outline_generated or st.session_state.outline_versions:
 # -------------------------
     st.divider()
     
-    # Auto-save the outline whenever beats are edited
-    # Reconstruct full outline from beats automatically
-    act1_text = "\n".join([f"- {beat}" for beat in st.session_state.act1_beats])
-    act2_text = "\n".join([f"- {beat}" for beat in st.session_state.act2_beats])
-    act3_text = "\n".join([f"- {beat}" for beat in st.session_state.act3_beats])
-    st.session_state.full_outline = f"""Act I - Setup\n{act1_text}\n\nAct II - Rising Action\n{act2_text}\n\nAct III - Climax & Resolution\n{act3_text}"""
+    # Edits are auto-saved by _persist_outline; the outline text is only
+    # re-serialized (by OutlineModel.text) after a beat changes
     
     # Clear outline button
     col1, col2, col3 = st.columns([1, 1, 1])
     with col2:
         if st.button("🗑️ Clear Outline", use_container_width=True):
             st.session_state.outline_generated = False
-            st.session_state.full_outline = ""
-            st.session_state.act1_beats = []
-            st.session_state.act2_beats = []
-            st.session_state.act3_beats = []
+            st.session_state.outline.clear()
             st.rerun()
+
+# -------------------------
+# 7. Persist Outline
+# -------------------------
+
+_persist_outline()
+
+# Full runs only: reruns of a fragment or ones cut short by st.rerun() aren't counted
+metrics.observe("app.rerun", time.perf_counter() - _rerun_started)
+if show_timings:
+    with st.sidebar:
+        with st.expander("⏱️ Timings", expanded=True):
+            st.dataframe(
+                [{"span": name, **stats} for name, stats in metrics.summary().items()],
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption("Recent timings of this server process, across all sessions.")
+            st.download_button(
+                "Prometheus metrics",
+                metrics.prometheus_text(),
+                file_name="outline_metrics.prom",
+                mime="text/plain"
+            )
@@ -0,0 +1,49 @@
+from parallel import run_parallel
+
+
+def chunk_text(text: str, max_chars: int) -> list[str]:
+    """Split text into chunks of at most `max_chars`, preferring paragraph then line boundaries."""
+    chunks = []
+    current = []
+    current_len = 0
+    for paragraph in text.split("\n\n"):
+        # Paragraphs that are too long on their own are split on lines, then hard-wrapped
+        pieces = [paragraph] if len(paragraph) <= max_chars else [
+            line[i:i + max_chars]
+            for line in paragraph.split("\n")
+            for i in range(0, max(len(line), 1), max_chars)
+        ]
+        for piece in pieces:
+            if current and current_len + len(piece) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+def condense_document(text, summarize, chunk_chars=12000, target_chars=8000, timeout=None, max_levels=4):
+    """Map-reduce summary of a long document.
+
+    The text is split into chunks that are summarized concurrently with
+    `summarize(chunk) -> str`; the joined summaries are summarized again
+    the same way until they fit in `target_chars` (or `max_levels` passes
+    have run). Raises RuntimeError if any chunk fails.
+    """
+    condensed = text
+    for _ in range(max_levels):
+        if len(condensed) <= target_chars:
+            break
+        chunks = chunk_text(condensed, chunk_chars)
+        outcomes = run_parallel(
+            {i: (lambda chunk=chunk: summarize(chunk)) for i, chunk in enumerate(chunks)},
+            timeout=timeout
+        )
+        failed = {i: error for i, (_, error) in outcomes.items() if error is not None}
+        if failed:
+            i, error = next(iter(failed.items()))
+            raise RuntimeError(f"{len(failed)} of {len(chunks)} document chunks could not be summarized (chunk {i + 1}: {error})")
+        condensed = "\n\n".join(outcomes[i][0].strip() for i in range(len(chunks)))
+    return condensed
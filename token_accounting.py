@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+# Rough conversion used when tiktoken is not installed or its encoding can't be loaded
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    """tiktoken encoding for `model`, or None to use the estimate; cached either way."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken downloads the BPE file on first use, which fails offline;
+        # the None is cached, so the download is not retried on every call
+        return None
+
+
+def estimate_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Token count of `text`: exact with tiktoken, otherwise ~4 characters per token."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def trim_to_token_budget(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Cut the middle out of `text` so it fits in `max_tokens`, keeping its start and end."""
+    tokens = estimate_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    marker = "\n\n[... trimmed to fit the prompt budget ...]\n\n"
+    keep_chars = max(int(len(text) * max_tokens / tokens) - len(marker), 0)
+    head = keep_chars * 2 // 3
+    tail = keep_chars - head
+    return text[:head] + marker + (text[-tail:] if tail else "")
+
+
+class UsageLedger:
+    """Token and latency accounting per call type (generate, regenerate-all, ...).
+
+    Keeps running totals in memory and, when `log_path` is set, appends one
+    JSON line per call so expensive interactions can be analysed offline.
+    `cached_tokens` is the part of the prompt the provider served from its
+    prompt cache. Safe to use from worker threads.
+    """
+
+    FIELDS = ("calls", "cache_hits", "estimated_prompt_tokens", "prompt_tokens", "cached_tokens",
+              "completion_tokens", "latency_s")
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._totals = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+        self._lock = threading.Lock()
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    def record(self, call_type, model, estimated_prompt_tokens, prompt_tokens=0, completion_tokens=0,
+               latency_s=0.0, cache_hit=False, cached_tokens=0, **extra):
+        entry = {
+            "time": time.time(),
+            "call_type": call_type,
+            "model": model,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_s": round(latency_s, 4),
+            "cache_hit": cache_hit,
+            **extra,
+        }
+        with self._lock:
+            totals = self._totals[call_type]
+            totals["calls"] += 1
+            totals["cache_hits"] += int(cache_hit)
+            totals["estimated_prompt_tokens"] += estimated_prompt_tokens
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["latency_s"] += latency_s
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def totals(self):
+        """{call_type: {field: total}} snapshot."""
+        with self._lock:
+            return {call_type: dict(t) for call_type, t in self._totals.items()}
+
+    def prompt_cache_hit_rate(self, call_type=None):
+        """Share of billed prompt tokens served from the provider's prompt cache."""
+        totals = self.totals()
+        if call_type is not None:
+            totals = {call_type: totals[call_type]} if call_type in totals else {}
+        rows = totals.values()
+        prompt_tokens = sum(t["prompt_tokens"] for t in rows)
+        return sum(t["cached_tokens"] for t in rows) / prompt_tokens if prompt_tokens else 0.0
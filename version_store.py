@@ -0,0 +1,148 @@
+from datetime import datetime
+
+from instrumentation import span
+from outline_parser import format_outline
+
+
+class VersionStore:
+    """Outline version history stored as per-beat deltas.
+
+    Every beat text is interned once in a shared pool and versions refer to
+    beats by id. Every `keyframe_interval`-th version is a keyframe holding
+    the full list of beat ids per act; the versions in between only record
+    the beats that differ from the latest keyframe. Memory therefore grows
+    with the amount of edited text rather than with versions x outline size,
+    and restoring a version is one keyframe lookup plus one delta.
+
+    Indexing returns the same dict shape the history UI used before
+    ('timestamp', 'label', 'outline', 'act1_beats', 'act2_beats', 'act3_beats').
+
+    `loader`, if given, is called the first time the history is accessed and
+    returns previously persisted versions as {'timestamp', 'acts', 'label'}
+    dicts; the label may be missing or None.
+
+    With `max_versions`, the history is compacted once it grows past that
+    many versions: the oldest tenth is dropped and the beat pool and
+    keyframes are rebuilt from the versions that remain.
+    """
+
+    def __init__(self, keyframe_interval=10, loader=None, max_versions=None):
+        self.keyframe_interval = keyframe_interval
+        self.max_versions = max_versions
+        self._loader = loader
+        self._beat_ids = {}
+        self._beats = []
+        # One dict per version: 'timestamp', 'label', 'sizes' (beats per act),
+        # 'keyframe' (index of its base keyframe) and 'acts' -- for keyframes a
+        # tuple of beat-id tuples, otherwise a tuple holding None (act
+        # unchanged) or (length, {index: beat_id}).
+        self._versions = []
+
+    def _ensure_loaded(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            for record in loader():
+                self._append(record['acts'], record['timestamp'], record.get('label'))
+            self._enforce_cap()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._versions)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, idx):
+        self._ensure_loaded()
+        version = self._versions[idx]
+        act1, act2, act3 = self.get_acts(idx)
+        return {
+            'timestamp': version['timestamp'],
+            'label': version['label'],
+            'outline': format_outline(act1, act2, act3),
+            'act1_beats': act1,
+            'act2_beats': act2,
+            'act3_beats': act3,
+        }
+
+    def metadata(self, start=0, stop=None):
+        """{'index', 'timestamp', 'label', 'sizes'} of versions[start:stop], without restoring any beats."""
+        self._ensure_loaded()
+        indices = range(len(self._versions))[start:stop]
+        return [
+            {'index': i, 'timestamp': v['timestamp'], 'label': v['label'], 'sizes': v['sizes']}
+            for i, v in zip(indices, self._versions[start:stop])
+        ]
+
+    @span("versions.append")
+    def append(self, act1, act2, act3, timestamp=None, label=None):
+        self._ensure_loaded()
+        timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._append((act1, act2, act3), timestamp, label)
+        self._enforce_cap()
+
+    def compact(self, keep=None):
+        """Drop all but the newest `keep` versions and rebuild the beat pool and keyframes."""
+        self._ensure_loaded()
+        start = 0 if keep is None else max(len(self._versions) - keep, 0)
+        kept = [(self.get_acts(i), v['timestamp'], v['label'])
+                for i, v in enumerate(self._versions[start:], start=start)]
+        self._beat_ids = {}
+        self._beats = []
+        self._versions = []
+        for acts, timestamp, label in kept:
+            self._append(acts, timestamp, label)
+
+    def _enforce_cap(self):
+        if self.max_versions is not None and len(self._versions) > self.max_versions:
+            # Trim a tenth below the cap so compaction doesn't run on every append
+            self.compact(self.max_versions - self.max_versions // 10)
+
+    def _append(self, beat_lists, timestamp, label):
+        acts = tuple(tuple(self._intern(b) for b in beats) for beats in beat_lists)
+        idx = len(self._versions)
+
+        if idx % self.keyframe_interval == 0:
+            version = {'keyframe': idx, 'acts': acts}
+        else:
+            base = self._versions[-1]['keyframe']
+            base_acts = self._versions[base]['acts']
+            version = {'keyframe': base, 'acts': tuple(
+                self._delta(base_act, act) for base_act, act in zip(base_acts, acts)
+            )}
+        version.update(timestamp=timestamp, label=label or timestamp, sizes=tuple(len(a) for a in acts))
+        self._versions.append(version)
+
+    def get_acts(self, idx):
+        """Beat lists (act1, act2, act3) of version `idx`."""
+        self._ensure_loaded()
+        idx = range(len(self._versions))[idx]
+        version = self._versions[idx]
+        base_acts = self._versions[version['keyframe']]['acts']
+        if version['keyframe'] == idx:
+            return tuple([self._beats[i] for i in act] for act in base_acts)
+        return tuple(
+            [self._beats[i] for i in self._apply(base_act, delta)]
+            for base_act, delta in zip(base_acts, version['acts'])
+        )
+
+    def _intern(self, beat):
+        beat_id = self._beat_ids.get(beat)
+        if beat_id is None:
+            beat_id = self._beat_ids[beat] = len(self._beats)
+            self._beats.append(beat)
+        return beat_id
+
+    @staticmethod
+    def _delta(base, ids):
+        if ids == base:
+            return None
+        changes = {i: beat_id for i, beat_id in enumerate(ids) if i >= len(base) or base[i] != beat_id}
+        return (len(ids), changes)
+
+    @staticmethod
+    def _apply(base, delta):
+        if delta is None:
+            return base
+        length, changes = delta
+        return [changes[i] if i in changes else base[i] for i in range(length)]